@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal
+from time import perf_counter
+
+import httpx
+
+from core.config import settings
+from database.redis_cache import RedisCache
+from database.session_manager import sessionmaker
+from repository.restaurant_repository import RestaurantRepository
+from service.restaurant_service import RestaurantService
+
+
+OPERATIONS = ('read_one', 'read_all', 'create', 'update', 'delete')
+
+MODES = ('cold', 'warm', 'mixed')
+
+
+@dataclass
+class Catalog:
+    tree: list[dict] = field(default_factory=list)
+    menu_ids: list[str] = field(default_factory=list)
+    submenu_keys: list[tuple[str, str]] = field(default_factory=list)
+    dish_keys: list[tuple[str, str, str]] = field(default_factory=list)
+    dish_id_to_title: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Timings:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    wall_time: float = 0.0
+    created_urls: list[str] = field(default_factory=list)
+
+    def summarize(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'wall_time_s': round(self.wall_time, 3),
+            'throughput_rps': round(len(latencies) / self.wall_time, 1) if self.wall_time else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+            **{f'p{percent}_ms': self.percentile(latencies, percent) for percent in (50, 95, 99)},
+        }
+
+    @staticmethod
+    def percentile(latencies: list[float], percent: int) -> float | None:
+        # Nearest rank, so the reported value is a latency that was actually measured.
+        if not latencies:
+            return None
+        return round(latencies[max(math.ceil(percent / 100 * len(latencies)) - 1, 0)] * 1000, 3)
+
+
+def construct_catalog(menus: int, submenus: int, dishes: int, seed: int) -> Catalog:
+    generator = random.Random(seed)
+    entity_id = lambda: str(uuid.UUID(int=generator.getrandbits(128), version=4))
+    catalog = Catalog()
+    for menu in range(menus):
+        menu_id = entity_id()
+        menu_tree = {'id': menu_id, 'title': f'Menu {menu}', 'description': 'Menu description', 'submenus': []}
+        catalog.menu_ids.append(menu_id)
+        for submenu in range(submenus):
+            submenu_id = entity_id()
+            submenu_tree = {
+                'id': submenu_id, 'title': f'Submenu {menu}.{submenu}', 'description': 'Submenu description',
+                'dishes': [],
+            }
+            catalog.submenu_keys.append((menu_id, submenu_id))
+            for dish in range(dishes):
+                dish_id = entity_id()
+                catalog.dish_id_to_title[dish_id] = f'Dish {menu}.{submenu}.{dish}'
+                submenu_tree['dishes'].append({
+                    'id': dish_id,
+                    'title': catalog.dish_id_to_title[dish_id],
+                    'description': 'Dish description',
+                    'price': str(Decimal(generator.randint(100, 99_999)) / 100),
+                    'discount': None,
+                })
+                catalog.dish_keys.append((menu_id, submenu_id, dish_id))
+            menu_tree['submenus'].append(submenu_tree)
+        catalog.tree.append(menu_tree)
+    return catalog
+
+
+def construct_dishes_url(menu_id: str, submenu_id: str) -> str:
+    return settings.url.target_dishes.format(target_menu_id=menu_id, target_submenu_id=submenu_id)
+
+
+def construct_dish_url(menu_id: str, submenu_id: str, dish_id: str) -> str:
+    return construct_dishes_url(menu_id, submenu_id) + settings.url.target_dish_id.format(target_dish_id=dish_id)
+
+
+class ApiBenchmark:
+    def __init__(self, client: httpx.AsyncClient, catalog: Catalog, arguments: argparse.Namespace) -> None:
+        self.client = client
+        self.catalog = catalog
+        self.requests = arguments.requests
+        self.concurrency = arguments.concurrency
+        self.write_ratio = arguments.write_ratio
+        self.generator = random.Random(arguments.seed)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.created_count = 0
+
+    async def seed(self) -> None:
+        # The sync endpoint replaces the whole catalog in one transaction.
+        response = await self.client.put(settings.url.target_menus + settings.url.target_sync, json=self.catalog.tree)
+        response.raise_for_status()
+        await self.invalidate()
+
+    async def invalidate(self) -> None:
+        async with sessionmaker() as session:
+            service = RestaurantService(RestaurantRepository(session), RedisCache())
+            await service.delete_catalog_cache(set(self.catalog.menu_ids))
+        if RedisCache.local_cache is not None:
+            RedisCache.local_cache.clear()
+
+    async def run_mode(self, mode: str) -> dict[str, dict]:
+        if mode == 'mixed':
+            return await self.run_mixed()
+
+        results, created_urls = {}, []
+        for operation in OPERATIONS:
+            requests = self.construct_requests(operation, created_urls)
+            if mode == 'cold':
+                await self.invalidate()
+            else:
+                await self.warm(requests)
+            timings = await self.run_requests(requests)
+            if operation == 'create':
+                created_urls = timings.created_urls
+            results[operation] = timings.summarize()
+        return results
+
+    async def run_mixed(self) -> dict[str, dict]:
+        # Reads hit warm caches while the writes keep invalidating them, the way production traffic does.
+        await self.warm(self.construct_requests('read_one', []) + self.construct_requests('read_all', []))
+        requests = []
+        for _ in range(self.requests):
+            if self.generator.random() < self.write_ratio:
+                requests.append(self.construct_update())
+            elif self.generator.random() < 0.5:
+                dish_key = self.generator.choice(self.catalog.dish_keys)
+                requests.append(('read_one', 'GET', construct_dish_url(*dish_key), None))
+            else:
+                submenu_key = self.generator.choice(self.catalog.submenu_keys)
+                requests.append(('read_all', 'GET', construct_dishes_url(*submenu_key), None))
+        operation_to_timings = await self.run_requests(requests, by_operation=True)
+        return {operation: timings.summarize() for operation, timings in operation_to_timings.items()}
+
+    def construct_requests(self, operation: str, created_urls: list[str]) -> list[tuple[str, str, str, dict | None]]:
+        # Reads go to distinct entities, so with a cold cache every request is a miss.
+        if operation == 'read_one':
+            keys = self.sample(self.catalog.dish_keys)
+            return [(operation, 'GET', construct_dish_url(*key), None) for key in keys]
+        if operation == 'read_all':
+            keys = self.sample(self.catalog.submenu_keys)
+            return [(operation, 'GET', construct_dishes_url(*key), None) for key in keys]
+        if operation == 'create':
+            return [self.construct_create() for _ in range(self.requests)]
+        if operation == 'update':
+            return [self.construct_update() for _ in range(self.requests)]
+        return [(operation, 'DELETE', url, None) for url in created_urls]
+
+    def construct_create(self) -> tuple[str, str, str, dict]:
+        self.created_count += 1
+        schema = {
+            'title': f'Benchmark dish {self.run_id}.{self.created_count}',
+            'description': 'Benchmark dish',
+            'price': '10.00',
+        }
+        return 'create', 'POST', construct_dishes_url(*self.generator.choice(self.catalog.submenu_keys)), schema
+
+    def construct_update(self) -> tuple[str, str, str, dict]:
+        # Titles are unique, so an update keeps the seeded one and changes the rest.
+        key = self.generator.choice(self.catalog.dish_keys)
+        schema = {
+            'title': self.catalog.dish_id_to_title[key[2]],
+            'description': f'Updated {self.generator.random()}',
+            'price': str(Decimal(self.generator.randint(100, 99_999)) / 100),
+        }
+        return 'update', 'PATCH', construct_dish_url(*key), schema
+
+    def sample(self, keys: list) -> list:
+        return self.generator.sample(keys, min(self.requests, len(keys)))
+
+    async def warm(self, requests: list[tuple[str, str, str, dict | None]]) -> None:
+        reads = [request for request in requests if request[1] == 'GET']
+        await self.run_requests(reads)
+
+    async def run_requests(self,
+                           requests: list[tuple[str, str, str, dict | None]],
+                           by_operation: bool = False) -> 'Timings | dict[str, Timings]':
+        operation_to_timings = {request[0]: Timings() for request in requests}
+        timings = Timings()
+        pending = iter(requests)
+
+        async def worker() -> None:
+            for operation, method, url, schema in pending:
+                started = perf_counter()
+                try:
+                    response = await self.client.request(method, url, json=schema)
+                    failed = response.is_error
+                except httpx.HTTPError:
+                    failed = True
+                elapsed = perf_counter() - started
+                for target in (timings, operation_to_timings[operation]):
+                    target.latencies.append(elapsed)
+                    target.errors += failed
+                if operation == 'create' and not failed:
+                    dish_id = response.json()['id']
+                    timings.created_urls.append(url + settings.url.target_dish_id.format(target_dish_id=dish_id))
+
+        started = perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        for target in (timings, *operation_to_timings.values()):
+            target.wall_time = perf_counter() - started
+        return operation_to_timings if by_operation else timings
+
+
+def construct_client(base_url: str | None) -> httpx.AsyncClient:
+    if base_url:
+        return httpx.AsyncClient(base_url=base_url, timeout=60)
+    # In process the ASGI transport waits for the background tasks as well, so their time adds to the latency.
+    from main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark', timeout=60)
+
+
+def print_results(mode_to_results: dict[str, dict[str, dict]]) -> None:
+    print(
+        f'{"mode":<6} {"operation":<9} {"requests":>8} {"errors":>6} {"rps":>8}'
+        f' {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+    )
+    for mode, results in mode_to_results.items():
+        for operation, result in results.items():
+            print(
+                f'{mode:<6} {operation:<9} {result["requests"]:>8} {result["errors"]:>6} {result["throughput_rps"]:>8}'
+                f' {result["p50_ms"] or 0:>8} {result["p95_ms"] or 0:>8} {result["p99_ms"] or 0:>8}'
+            )
+
+
+async def main(arguments: argparse.Namespace) -> None:
+    catalog = construct_catalog(arguments.menus, arguments.submenus, arguments.dishes, arguments.seed)
+    async with construct_client(arguments.base_url) as client:
+        benchmark = ApiBenchmark(client, catalog, arguments)
+        if not arguments.skip_seed:
+            await benchmark.seed()
+        mode_to_results = {mode: await benchmark.run_mode(mode) for mode in arguments.modes}
+
+    print_results(mode_to_results)
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {key: value for key, value in vars(arguments).items() if key != 'output'},
+        'results': mode_to_results,
+    }
+    os.makedirs(os.path.dirname(arguments.output) or '.', exist_ok=True)
+    with open(arguments.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f'Saved to {arguments.output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load the API with concurrent clients and report latency percentiles per operation. '
+                    'Seeding replaces the whole catalog of the configured database, run it against a local one.'
+    )
+    parser.add_argument('--menus', type=int, default=10)
+    parser.add_argument('--submenus', type=int, default=10)
+    parser.add_argument('--dishes', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per operation and mode')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='share of updates in the mixed mode')
+    parser.add_argument('--base-url', help='a running server, by default the app is driven in process')
+    parser.add_argument(
+        '--skip-seed', action='store_true', help='reuse the catalog seeded before with the same shape and seed'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=f'benchmark-results/api-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+import argparse
+import random
+import uuid
+
+from openpyxl import Workbook
+
+
+def generate_workbook(path: str,
+                      menus: int,
+                      submenus: int,
+                      dishes: int,
+                      missing_id_ratio: float = 0.0,
+                      seed: int = 0,
+                      changed_ratio: float = 0.0,
+                      added_ratio: float = 0.0,
+                      removed_ratio: float = 0.0) -> int:
+    # Same layout as admin/Menu_2.xlsx: menus in columns 1-3, submenus in 2-4 and dishes in 3-7.
+    # The edits draw from a generator of their own, so a workbook with edits is an edited copy of the one
+    # generated with the same seed and no edits, with the same ids.
+    generator = random.Random(seed)
+    edit_generator = random.Random(f'{seed}:edits')
+
+    def entity_id() -> str | None:
+        if generator.random() < missing_id_ratio:
+            return None
+        return str(uuid.UUID(int=generator.getrandbits(128), version=4))
+
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet()
+    rows = 0
+    for menu in range(menus):
+        sheet.append([entity_id() or 'new', f'Menu {menu}', f'Menu {menu} description'])
+        rows += 1
+        for submenu in range(submenus):
+            sheet.append([None, entity_id() or 'new', f'Submenu {menu}.{submenu}', 'Submenu description'])
+            rows += 1
+            for dish in range(dishes):
+                price = round(generator.uniform(50, 5000), 2)
+                discount = generator.choice((None, None, None, 5, 10, 15))
+                dish_id = entity_id() or 'new'
+                edit = edit_generator.random()
+                if edit < removed_ratio:
+                    continue
+                if edit < removed_ratio + changed_ratio:
+                    price = round(price * 1.1, 2)
+                sheet.append([
+                    None, None, dish_id, f'Dish {menu}.{submenu}.{dish}', 'Dish description', price, discount
+                ])
+                rows += 1
+            for dish in range(dishes):
+                if edit_generator.random() < added_ratio:
+                    dish_id = str(uuid.UUID(int=edit_generator.getrandbits(128), version=4))
+                    sheet.append([None, None, dish_id, f'Added dish {menu}.{submenu}.{dish}', 'Dish description', 100])
+                    rows += 1
+    book.save(path)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic menu workbook.')
+    parser.add_argument('path')
+    parser.add_argument('--menus', type=int, default=20)
+    parser.add_argument('--submenus', type=int, default=50)
+    parser.add_argument('--dishes', type=int, default=99)
+    parser.add_argument('--missing-id-ratio', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--changed-ratio', type=float, default=0.0, help='share of dishes with a new price')
+    parser.add_argument('--added-ratio', type=float, default=0.0, help='share of dishes added to every submenu')
+    parser.add_argument('--removed-ratio', type=float, default=0.0, help='share of dishes left out')
+    arguments = parser.parse_args()
+    rows = generate_workbook(
+        arguments.path, arguments.menus, arguments.submenus, arguments.dishes, arguments.missing_id_ratio,
+        arguments.seed, arguments.changed_ratio, arguments.added_ratio, arguments.removed_ratio,
+    )
+    print(f'{rows} rows written to {arguments.path}')
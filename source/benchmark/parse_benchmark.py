@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+import os
+import tempfile
+from time import perf_counter
+
+from benchmark.generate_workbook import generate_workbook
+from task.parser_xlsx_service import ParserXlsxService, shutdown_parse_pool
+
+
+async def parse(path: str, workers: int) -> tuple[float, int]:
+    parser = ParserXlsxService(streaming=True, workers=workers)
+    started = perf_counter()
+    parser.load_file(path)
+    restaurant_menu = await parser.get_restaurant_menu()
+    return perf_counter() - started, len(restaurant_menu.menu_id_submenu_id_dish_id_to_dish)
+
+
+async def main(arguments: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'menu.xlsx')
+        rows = generate_workbook(path, arguments.menus, arguments.submenus, arguments.dishes)
+        print(f'{rows} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MiB')
+        for workers in arguments.workers:
+            timings = []
+            for _ in range(arguments.repeat):
+                elapsed, dishes = await parse(path, workers)
+                timings.append(elapsed)
+            label = 'in-process' if workers == 0 else f'{workers} workers'
+            print(f'{label:>12}: best {min(timings):.2f}s, {dishes} dishes')
+            # Every worker count gets a fresh pool of its own size.
+            shutdown_parse_pool()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the XLSX parse in-process and in a process pool.')
+    parser.add_argument('--menus', type=int, default=20)
+    parser.add_argument('--submenus', type=int, default=50)
+    parser.add_argument('--dishes', type=int, default=99)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import tempfile
+import time
+from time import perf_counter
+
+from benchmark.generate_workbook import generate_workbook
+from core.config import settings
+from task.fingerprint_index import FingerprintIndex
+from task.http_client_admin_restaurant import HttpClientAdminRestaurant
+from task.parser_service import RestaurantMenu
+from task.parser_xlsx_service import ParserXlsxService, shutdown_parse_pool
+from tests.fake_restaurant_api import FakeRestaurantApi
+
+
+async def parse(path: str, workers: int = 0) -> tuple[float, RestaurantMenu]:
+    parser = ParserXlsxService(workers=workers)
+    started = perf_counter()
+    parser.load_file(path)
+    try:
+        restaurant_menu = await parser.get_restaurant_menu()
+    finally:
+        parser.close()
+    return perf_counter() - started, restaurant_menu
+
+
+async def run_phase(api: FakeRestaurantApi, coroutine) -> dict:
+    api.count_requests()
+    started = perf_counter()
+    await coroutine
+    elapsed = perf_counter() - started
+    method_to_count = api.count_requests()
+    return {'wall_time_s': round(elapsed, 3), 'requests': sum(method_to_count.values()), **method_to_count}
+
+
+async def benchmark_size(directory: str, dishes_total: int, arguments: argparse.Namespace) -> dict:
+    menus = math.ceil(dishes_total / (arguments.submenus * arguments.dishes))
+    base_path, changed_path = os.path.join(directory, 'base.xlsx'), os.path.join(directory, 'changed.xlsx')
+    generate_workbook(base_path, menus, arguments.submenus, arguments.dishes, seed=arguments.seed)
+    generate_workbook(
+        changed_path, menus, arguments.submenus, arguments.dishes, seed=arguments.seed,
+        changed_ratio=arguments.changed_ratio, added_ratio=arguments.added_ratio, removed_ratio=arguments.removed_ratio,
+    )
+
+    api = FakeRestaurantApi(arguments.latency_ms / 1000)
+    client = HttpClientAdminRestaurant(transport=api.construct_transport())
+    results = {'dishes': menus * arguments.submenus * arguments.dishes}
+
+    parse_time, base_menu = await parse(base_path, arguments.workers)
+    results['parse_base'] = {'wall_time_s': round(parse_time, 3)}
+    results['initial_load'] = await run_phase(api, client.load_restaurant_menu_in_db(base_menu))
+    snapshot = api.snapshot()
+
+    parse_time, changed_menu = await parse(changed_path, arguments.workers)
+    results['parse_changed'] = {'wall_time_s': round(parse_time, 3)}
+
+    started = perf_counter()
+    change_set = FingerprintIndex.diff(
+        FingerprintIndex.construct_fingerprints(base_menu), FingerprintIndex.construct_fingerprints(changed_menu)
+    )
+    results['diff'] = {
+        'wall_time_s': round(perf_counter() - started, 3),
+        'added': len(change_set.added),
+        'changed': len(change_set.changed),
+        'removed': len(change_set.removed),
+    }
+    results['apply'] = await run_phase(api, client.apply_changes(changed_menu, change_set))
+
+    # The same edit through the reconciling sync that runs without fingerprints, against the same starting state.
+    api.restore(snapshot)
+    results['full_sync'] = await run_phase(api, client.load_restaurant_menu_in_db(changed_menu))
+    return results
+
+
+def print_results(size_to_results: dict[int, dict]) -> None:
+    print(f'{"dishes":>8} {"phase":<14} {"wall s":>8} {"requests":>9}  details')
+    for results in size_to_results.values():
+        for phase, result in results.items():
+            if phase == 'dishes':
+                continue
+            details = ', '.join(
+                f'{key} {value}' for key, value in result.items() if key not in ('wall_time_s', 'requests')
+            )
+            print(
+                f'{results["dishes"]:>8} {phase:<14} {result["wall_time_s"]:>8} {result.get("requests", ""):>9}'
+                f'  {details}'
+            )
+
+
+async def main(arguments: argparse.Namespace) -> None:
+    settings.sync.concurrency = arguments.concurrency
+    size_to_results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for dishes_total in arguments.sizes:
+            size_to_results[dishes_total] = await benchmark_size(directory, dishes_total, arguments)
+    shutdown_parse_pool()
+
+    print_results(size_to_results)
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {key: value for key, value in vars(arguments).items() if key != 'output'},
+        'results': list(size_to_results.values()),
+    }
+    os.makedirs(os.path.dirname(arguments.output) or '.', exist_ok=True)
+    with open(arguments.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f'Saved to {arguments.output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time the parse, diff and apply phases of the menu sync for generated workbooks '
+                    'against an in-memory stand-in of the API.'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000], help='dishes per workbook')
+    parser.add_argument('--submenus', type=int, default=20, help='submenus per menu')
+    parser.add_argument('--dishes', type=int, default=50, help='dishes per submenu')
+    parser.add_argument('--changed-ratio', type=float, default=0.05)
+    parser.add_argument('--added-ratio', type=float, default=0.01)
+    parser.add_argument('--removed-ratio', type=float, default=0.01)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated round trip of every request')
+    parser.add_argument('--concurrency', type=int, default=settings.sync.concurrency)
+    parser.add_argument('--workers', type=int, default=0, help='parse processes, 0 parses in process')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=f'benchmark-results/sync-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    asyncio.run(main(parser.parse_args()))
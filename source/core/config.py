@@ -28,6 +28,12 @@ class RedisSettings:
     REDIS_PORT: str = os.environ['REDIS_PORT']
     url: str = f'redis://{REDIS_HOST}:{REDIS_PORT}'
     ttl: int = timedelta(minutes=15).seconds
+    local_cache_enabled: bool = os.environ.get('LOCAL_CACHE_ENABLED', 'false').lower() == 'true'
+    local_cache_max_entries: int = int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 10_000))
+    local_cache_max_bytes: int = int(os.environ.get('LOCAL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    local_cache_ttl: int = int(os.environ.get('LOCAL_CACHE_TTL', 30))
+    invalidation_channel: str = 'cache:invalidation'
+    max_cached_pages: int = int(os.environ.get('MAX_CACHED_PAGES', 5))
 
 
 @dataclass
@@ -37,10 +43,91 @@ class UrlSettings:
     prefix: str = '/api/v1'
     target_menus: str = f'{prefix}/menus'
     target_menu_id: str = '/{target_menu_id}'
+    target_tree: str = '/tree'
     target_submenus: str = f'{target_menus}{target_menu_id}/submenus'
     target_submenu_id: str = '/{target_submenu_id}'
     target_dishes: str = f'{target_submenus}{target_submenu_id}/dishes'
     target_dish_id: str = '/{target_dish_id}'
+    target_bulk: str = '/bulk'
+    target_sync: str = '/sync'
+    target_metrics: str = '/metrics'
+
+
+@dataclass
+class PageSettings:
+    default_limit: int = 100
+    max_limit: int = 1000
+
+
+@dataclass
+class BulkSettings:
+    max_size: int = 5000
+    chunk_size: int = 1000
+
+
+@dataclass
+class MetricsSettings:
+    enabled: bool = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    # prometheus_client reads the same variable on import: with it every process writes its samples to files there,
+    # so a scrape of any uvicorn worker covers all of them. The directory is wiped before the workers start.
+    multiprocess_directory: str = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')
+
+
+@dataclass
+class TracingSettings:
+    # '' keeps tracing off, 'console' prints the spans, 'file' appends them to file_path one JSON per line
+    # and 'otlp' sends them to the collector at OTEL_EXPORTER_OTLP_ENDPOINT.
+    exporter: str = os.environ.get('TRACING_EXPORTER', '')
+    file_path: str = os.environ.get('TRACING_FILE', 'traces.jsonl')
+    service_name: str = os.environ.get('TRACING_SERVICE_NAME', 'restaurant-api')
+
+
+@dataclass
+class ProfilingSettings:
+    # Off by default: a request carrying the header is profiled with cProfile, with a token set the header holds it.
+    enabled: bool = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    header: str = 'X-Profile'
+    token: str = os.environ.get('PROFILING_TOKEN', '')
+    directory: str = os.environ.get('PROFILING_DIR', 'profiles')
+    top_functions: int = int(os.environ.get('PROFILING_TOP_FUNCTIONS', 40))
+    # Statements slower than this are logged with their parameters, 0 turns the log off.
+    slow_query_ms: float = float(os.environ.get('SLOW_QUERY_MS', 0))
+    explain_slow_queries: bool = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+
+
+@dataclass
+class ParserSettings:
+    # Streaming reads the sheet row by row through a read-only workbook instead of loading it whole.
+    streaming: bool = os.environ.get('XLSX_STREAMING', 'true').lower() == 'true'
+    # How rows without an id get one: 'write_back' into the sheet, a 'sidecar' id map or a 'uuid5' of the titles.
+    id_mode: str = os.environ.get('XLSX_ID_MODE', 'write_back')
+    # With workers a sheet is split on menu rows into one shard per worker and parsed in a process pool.
+    # Prefork processes are daemonic and may not fork, so the Celery worker runs with --pool=solo.
+    workers: int = int(os.environ.get('XLSX_PARSE_WORKERS', 0))
+    csv_delimiter: str = os.environ.get('CSV_DELIMITER', ',')
+
+
+@dataclass
+class SyncSettings:
+    # 'http' replays the sheet through the public API entity by entity, 'tree' pushes it whole to the sync
+    # endpoint and 'db' merges it into the tables directly.
+    backend: str = os.environ.get('SYNC_BACKEND', 'http')
+    concurrency: int = int(os.environ.get('SYNC_CONCURRENCY', 10))
+    # Only entities whose fingerprint changed since the previous run are sent through the HTTP backend.
+    incremental: bool = os.environ.get('SYNC_INCREMENTAL', 'true').lower() == 'true'
+    fingerprint_key: str = 'Sync:Fingerprints'
+    file_state_key: str = 'Sync:File'
+    # The files of the menu directory synced so far, so the menus of a removed file can be deleted.
+    files_key: str = 'Sync:Files'
+    # 'beat' polls the file on a schedule, 'watch' leaves it to the file watcher in task.watcher (the watcher service).
+    trigger: str = os.environ.get('SYNC_TRIGGER', 'beat')
+    # Splits an HTTP sync into one Celery task per menu subtree, joined by a chord.
+    fan_out: bool = os.environ.get('SYNC_FAN_OUT', 'false').lower() == 'true'
+    lock_key: str = 'Lock:load_menu'
+    lock_ttl_ms: int = int(os.environ.get('SYNC_LOCK_TTL_MS', timedelta(minutes=10).seconds * 1000))
+    watch_debounce_ms: int = int(os.environ.get('SYNC_WATCH_DEBOUNCE_MS', 1000))
+    # Stat polling instead of file system events, for mounts that deliver no events such as network shares.
+    watch_polling: bool = os.environ.get('SYNC_WATCH_POLLING', 'false').lower() == 'true'
 
 
 class CelerySettings:
@@ -50,14 +137,26 @@ class CelerySettings:
     RABBITMQ_HOST: str = os.environ['RABBITMQ_HOST']
     RABBITMQ_DEFAULT_VHOST: str = os.environ['RABBITMQ_DEFAULT_VHOST']
     broker_url = f'amqp://{RABBITMQ_DEFAULT_USER}:{RABBITMQ_DEFAULT_PASS}@{RABBITMQ_HOST}:{RABBITMQ_DEFAULT_PORT}/{RABBITMQ_DEFAULT_VHOST}'
+    # Chords need a result backend to collect the subtask results.
+    result_backend = f'redis://{os.environ["REDIS_HOST"]}:{os.environ["REDIS_PORT"]}/1'
 
 
 class Settings:
     db: DbSettings = DbSettings()
     redis_cache: RedisSettings = RedisSettings()
     url: UrlSettings = UrlSettings()
+    page: PageSettings = PageSettings()
+    bulk: BulkSettings = BulkSettings()
+    metrics: MetricsSettings = MetricsSettings()
+    tracing: TracingSettings = TracingSettings()
+    profiling: ProfilingSettings = ProfilingSettings()
+    parser: ParserSettings = ParserSettings()
+    sync: SyncSettings = SyncSettings()
     celery: CelerySettings = CelerySettings()
-    file_path: str = BASE_DIR / 'source/admin/Menu_2.xlsx'
+    # The extension picks the parser: .xlsx, .csv or .ndjson (.jsonl).
+    file_path: str = os.environ.get('MENU_FILE_PATH', BASE_DIR / 'source/admin/Menu_2.xlsx')
+    # With a directory every menu file in it is synced on its own and file_path is not used.
+    menu_dir: str | None = os.environ.get('MENU_DIR')
 
 
 settings = Settings()
@@ -0,0 +1,132 @@
+import os
+from functools import wraps
+from time import perf_counter
+from typing import Any, Awaitable, Callable
+
+from opentelemetry import context
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+from core.tracing import tracer
+
+
+# Seconds, from a local Redis round trip up to a slow sync request.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time until the response was sent, per route template.',
+    ('method', 'route', 'status'), buckets=DEFAULT_BUCKETS,
+)
+
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Cache lookups of the service by entity, kind of value and result.', ('cache', 'kind', 'result')
+)
+
+LOCAL_CACHE_LOOKUPS = Counter(
+    'local_cache_lookups', 'Hits, misses and evictions of the in-process cache.', ('cache', 'kind', 'result')
+)
+
+REDIS_LATENCY = Histogram(
+    'redis_command_duration_seconds', 'Redis round trips of RedisCache.', ('command',), buckets=DEFAULT_BUCKETS
+)
+
+SQL_LATENCY = Histogram(
+    'sql_statement_duration_seconds', 'SQL statements by their first keyword.', ('operation',), buckets=DEFAULT_BUCKETS
+)
+
+# A gauge of every process is written to its own file, livesum adds up those of the processes still running.
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Connections of the engine pools by state.', ('state',), multiprocess_mode='livesum'
+)
+
+BACKGROUND_TASK_QUEUE_TIME = Histogram(
+    'background_task_queue_seconds', 'Time from add_task until the background task started.', ('task',),
+    buckets=DEFAULT_BUCKETS,
+)
+
+BACKGROUND_TASK_LATENCY = Histogram(
+    'background_task_duration_seconds', 'Run time of background tasks.', ('task', 'status'), buckets=DEFAULT_BUCKETS
+)
+
+
+def render_metrics() -> bytes:
+    # The uvicorn workers write their samples to files of the multiprocess directory and any of them may serve
+    # the scrape, so it is answered from all the files rather than from the memory of this process.
+    if not settings.metrics.multiprocess_directory:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=settings.metrics.multiprocess_directory)
+    return generate_latest(registry)
+
+
+def close_metrics() -> None:
+    # The live gauges of a stopped worker would otherwise be summed until the directory is wiped.
+    if settings.metrics.multiprocess_directory:
+        multiprocess.mark_process_dead(os.getpid(), settings.metrics.multiprocess_directory)
+
+
+def track_task(function: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    # Wraps a function handed to BackgroundTasks.add_task, the queue time counts from the wrapping
+    # and the span of the task hangs under the span that queued it.
+    queued, parent = perf_counter(), context.get_current()
+    task_name = function.__name__
+
+    @wraps(function)
+    async def wrapper(*args, **kwargs) -> Any:
+        started = perf_counter()
+        BACKGROUND_TASK_QUEUE_TIME.labels(task=task_name).observe(started - queued)
+        status = 'error'
+        try:
+            attributes = {'queue_seconds': started - queued}
+            with tracer.start_as_current_span(f'background {task_name}', context=parent, attributes=attributes):
+                result = await function(*args, **kwargs)
+            status = 'ok'
+            return result
+        finally:
+            BACKGROUND_TASK_LATENCY.labels(task=task_name, status=status).observe(perf_counter() - started)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    # Plain ASGI, so the background tasks that run after the response are not counted into the route.
+    def __init__(self, app: ASGIApp, skipped_paths: tuple[str, ...] = ()) -> None:
+        self.app = app
+        self.skipped_paths = skipped_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] in self.skipped_paths:
+            return await self.app(scope, receive, send)
+
+        started, status = perf_counter(), 500
+
+        async def send_observed(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                self._observe(scope, status, started)
+
+        try:
+            await self.app(scope, receive, send_observed)
+        except Exception:
+            self._observe(scope, status, started)
+            raise
+
+    @staticmethod
+    def _observe(scope: Scope, status: int, started: float) -> None:
+        # The route template keeps the ids out of the labels, unmatched paths are not recorded.
+        if (route := scope.get('route')) is None:
+            return
+        labels = {'method': scope['method'], 'route': route.path, 'status': str(status)}
+        REQUEST_LATENCY.labels(**labels).observe(perf_counter() - started)
@@ -0,0 +1,61 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import time
+import uuid
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class ProfilingMiddleware:
+    # The report of a profiled request is stored under directory, its name comes back in X-Profile-Report.
+    # cProfile follows the thread, so coroutines of other requests running meanwhile show up in the report too.
+    def __init__(self, app: ASGIApp, header: str, token: str, directory: str, top_functions: int) -> None:
+        self.app = app
+        self.header = header.lower().encode()
+        self.token = token
+        self.directory = directory
+        self.top_functions = top_functions
+        self._active = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Only one profiler can be enabled at a time, a request arriving meanwhile runs unprofiled.
+        if scope['type'] != 'http' or self._active or not self._is_requested(scope):
+            return await self.app(scope, receive, send)
+
+        report_name = f'{time.strftime("%Y%m%d-%H%M%S")}-{scope["method"].lower()}-{uuid.uuid4().hex[:8]}'
+
+        async def send_with_report(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                headers = [*message.get('headers', ()), (b'x-profile-report', report_name.encode())]
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_report)
+        finally:
+            profiler.disable()
+            self._active = False
+            self._write_report(profiler, report_name, scope)
+
+    def _is_requested(self, scope: Scope) -> bool:
+        value = dict(scope['headers']).get(self.header)
+        if value is None:
+            return False
+        return not self.token or hmac.compare_digest(value, self.token.encode())
+
+    def _write_report(self, profiler: cProfile.Profile, report_name: str, scope: Scope) -> None:
+        # The .prof file loads into pstats or snakeviz, the .txt file is the summary to read right away.
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, report_name)
+        profiler.dump_stats(f'{path}.prof')
+        summary = io.StringIO()
+        summary.write(f'{scope["method"]} {scope["path"]}?{scope["query_string"].decode("latin-1")}\n')
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(self.top_functions)
+        with open(f'{path}.txt', 'w', encoding='utf-8') as file:
+            file.write(summary.getvalue())
@@ -0,0 +1,78 @@
+import inspect
+from functools import wraps
+from typing import Any, Callable
+
+from fastapi import FastAPI
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.redis import RedisInstrumentor
+from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core.config import settings
+
+
+# Bound to the global provider through a proxy, so it is usable before setup_tracing and a no-op without it.
+tracer = trace.get_tracer(__name__)
+
+
+def format_span_line(span: ReadableSpan) -> str:
+    return span.to_json(indent=None) + '\n'
+
+
+def construct_exporter() -> SpanExporter:
+    if settings.tracing.exporter == 'console':
+        return ConsoleSpanExporter()
+    if settings.tracing.exporter == 'file':
+        # Line buffered, so a span is on disk once it was exported and a killed process loses nothing more.
+        output = open(settings.tracing.file_path, 'a', buffering=1, encoding='utf-8')
+        return ConsoleSpanExporter(out=output, formatter=format_span_line)
+    if settings.tracing.exporter == 'otlp':
+        # The endpoint, headers and timeout come from the OTEL_EXPORTER_OTLP_* variables.
+        return OTLPSpanExporter()
+    raise ValueError(f'TRACING_EXPORTER must be console, file or otlp, got {settings.tracing.exporter!r}')
+
+
+def setup_tracing(engine: AsyncEngine) -> None:
+    # Without an exporter the API keeps its no-op provider and nothing is instrumented.
+    if not settings.tracing.exporter:
+        return
+    provider = TracerProvider(resource=Resource.create({SERVICE_NAME: settings.tracing.service_name}))
+    provider.add_span_processor(BatchSpanProcessor(construct_exporter()))
+    trace.set_tracer_provider(provider)
+    SQLAlchemyInstrumentor().instrument(engine=engine.sync_engine)
+    RedisInstrumentor().instrument()
+
+
+def instrument_app(app: FastAPI, skipped_paths: tuple[str, ...] = ()) -> None:
+    if settings.tracing.exporter:
+        FastAPIInstrumentor.instrument_app(app, excluded_urls=','.join(skipped_paths))
+
+
+def close_tracing() -> None:
+    # Flushes the spans still queued in the batch processor.
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, TracerProvider):
+        provider.shutdown()
+
+
+def traced(name: str) -> Callable:
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        async def wrapper(*args, **kwargs) -> Any:
+            with tracer.start_as_current_span(name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(cls: type) -> type:
+    # Every public coroutine method of the class gets a span named after the class and the method.
+    for attribute_name, attribute in list(vars(cls).items()):
+        if not attribute_name.startswith('_') and inspect.iscoroutinefunction(attribute):
+            setattr(cls, attribute_name, traced(f'{cls.__name__}.{attribute_name}')(attribute))
+    return cls
@@ -0,0 +1,31 @@
+import hashlib
+import json
+from typing import Any
+
+from pydantic import TypeAdapter
+
+
+CACHE_FORMAT_VERSION = 1
+
+
+class CacheSerializer:
+    def __init__(self, schema: Any) -> None:
+        self.adapter = TypeAdapter(schema)
+        self.header = self._construct_header(self.adapter)
+
+    def dumps(self, value: Any) -> bytes:
+        return self.header + self.render(value)
+
+    def render(self, value: Any) -> bytes:
+        return self.adapter.dump_json(self.adapter.validate_python(value, from_attributes=True))
+
+    def loads(self, value: bytes | None) -> bytes | None:
+        if value is None or not value.startswith(self.header):
+            return None
+        return value[len(self.header):]
+
+    @staticmethod
+    def _construct_header(adapter: TypeAdapter) -> bytes:
+        # The schema digest makes entries written by a different schema version read as misses.
+        json_schema = json.dumps(adapter.json_schema(), sort_keys=True).encode()
+        return b'v%d.%s|' % (CACHE_FORMAT_VERSION, hashlib.sha256(json_schema).hexdigest()[:12].encode())
@@ -1,8 +1,8 @@
 import uuid
 
-from sqlalchemy import DECIMAL, ForeignKey, String, func, select, Integer
+from sqlalchemy import DDL, DECIMAL, ForeignKey, String, Integer, event
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, column_property
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
 class Base(DeclarativeBase):
@@ -32,13 +32,9 @@ class Submenu(Base):
     title: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     description: Mapped[str] = mapped_column(String, nullable=False)
     menu_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('menu.id', ondelete='cascade'))
-    dish: Mapped['Dish'] = relationship(back_populates='submenu')
+    dish: Mapped[list['Dish']] = relationship(back_populates='submenu')
     menu: Mapped['Menu'] = relationship(back_populates='submenu')
-    dishes_count = column_property(
-        select(func.count(Dish.id)).
-        where(Dish.submenu_id == id).
-        correlate_except(Dish).scalar_subquery()
-    )
+    dishes_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
 
 
 class Menu(Base):
@@ -47,14 +43,59 @@ class Menu(Base):
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     description: Mapped[str] = mapped_column(String, nullable=False)
-    submenu: Mapped['Submenu'] = relationship(back_populates='menu', cascade='all, delete')
-    submenus_count = column_property(
-        select(func.count(Submenu.id)).
-        where(Submenu.menu_id == id).
-        correlate_except(Submenu).scalar_subquery()
-    )
-    dishes_count = column_property(
-        select(func.count(Dish.id)).
-        where(Dish.submenu_id == Submenu.id, Submenu.menu_id == id).
-        correlate_except(Dish).scalar_subquery()
-    )
+    submenu: Mapped[list['Submenu']] = relationship(back_populates='menu', cascade='all, delete')
+    submenus_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    dishes_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+
+
+# Counters are kept by the database itself, so bulk statements and FK cascades stay consistent.
+COUNTER_TRIGGERS = (
+    """
+    CREATE OR REPLACE FUNCTION submenu_counters() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE menu
+            SET submenus_count = submenus_count - 1, dishes_count = dishes_count - OLD.dishes_count
+            WHERE id = OLD.menu_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE menu
+            SET submenus_count = submenus_count + 1, dishes_count = dishes_count + NEW.dishes_count
+            WHERE id = NEW.menu_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dish_counters() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE submenu SET dishes_count = dishes_count - 1 WHERE id = OLD.submenu_id;
+            UPDATE menu SET dishes_count = menu.dishes_count - 1
+            FROM submenu WHERE submenu.id = OLD.submenu_id AND menu.id = submenu.menu_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE submenu SET dishes_count = dishes_count + 1 WHERE id = NEW.submenu_id;
+            UPDATE menu SET dishes_count = menu.dishes_count + 1
+            FROM submenu WHERE submenu.id = NEW.submenu_id AND menu.id = submenu.menu_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    # CREATE TRIGGER has no IF NOT EXISTS, the drops keep a second create_all on an existing schema working.
+    'DROP TRIGGER IF EXISTS submenu_counters ON submenu',
+    """
+    CREATE TRIGGER submenu_counters AFTER INSERT OR DELETE OR UPDATE OF menu_id ON submenu
+    FOR EACH ROW EXECUTE FUNCTION submenu_counters()
+    """,
+    'DROP TRIGGER IF EXISTS dish_counters ON dish',
+    """
+    CREATE TRIGGER dish_counters AFTER INSERT OR DELETE OR UPDATE OF submenu_id ON dish
+    FOR EACH ROW EXECUTE FUNCTION dish_counters()
+    """,
+)
+
+for statement in COUNTER_TRIGGERS:
+    event.listen(Base.metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
@@ -1,28 +1,281 @@
+import asyncio
+import json
+import logging
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterable, Iterator, NamedTuple, Sequence
+
 from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
 
 from core.config import settings
+from core.metrics import LOCAL_CACHE_LOOKUPS, REDIS_LATENCY
+
+
+logger = logging.getLogger(__name__)
+
+TREE_CACHE_KEY = 'Tree'
+
+PAGE_CACHE_SUFFIX = 'Page'
+
+
+def construct_cache_labels(name: str, key: str) -> tuple[str, str]:
+    # Names are Menu:<menu_id>:Submenu:<submenu_id>:Dish: with Page appended for the pages. The level the ids
+    # stop at and the kind of value are the labels, the ids themselves would make a series per entity.
+    parts = name.split(':')
+    if len(parts) != 6:
+        return parts[0], 'other'
+    menu, menu_id, submenu, submenu_id, dish, suffix = parts
+    cache = dish if submenu_id else submenu if menu_id else menu
+    if suffix == PAGE_CACHE_SUFFIX:
+        return cache, 'page'
+    return cache, 'tree' if key == TREE_CACHE_KEY else 'all' if key == cache else 'one'
+
+
+class LocalCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int, version_slots: int = 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        # Versions of the names hashed into a fixed table: an invalidation only makes the reads of names in its
+        # slot stale, and the table does not grow with the names.
+        self.versions = [0] * version_slots
+        self._entries: OrderedDict[tuple[str, str], tuple[float, bytes]] = OrderedDict()
+        self._name_to_keys: defaultdict[str, set[str]] = defaultdict(set)
+
+    def get(self, name: str, key: str) -> bytes | None:
+        entry = self._entries.get((name, key))
+        if entry is None or entry[0] < monotonic():
+            if entry is not None:
+                self._pop(name, key)
+            LOCAL_CACHE_LOOKUPS.labels(*construct_cache_labels(name, key), 'misses').inc()
+            return None
+        self._entries.move_to_end((name, key))
+        LOCAL_CACHE_LOOKUPS.labels(*construct_cache_labels(name, key), 'hits').inc()
+        return entry[1]
+
+    def get_version(self, name: str) -> int:
+        return self.versions[self._construct_slot(name)]
+
+    def set(self, name: str, key: str, value: bytes, version: int) -> None:
+        # An invalidation of the name that arrived while the value was read from Redis makes it stale already.
+        if version != self.get_version(name) or len(value) > self.max_bytes:
+            return
+        self._pop(name, key)
+        self._entries[(name, key)] = (monotonic() + self.ttl, value)
+        self._name_to_keys[name].add(key)
+        self.size += len(value)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            (evicted_name, evicted_key), _ = next(iter(self._entries.items()))
+            self._pop(evicted_name, evicted_key)
+            LOCAL_CACHE_LOOKUPS.labels(*construct_cache_labels(evicted_name, evicted_key), 'evictions').inc()
+
+    def invalidate(self, name: str, *keys: str) -> None:
+        self.versions[self._construct_slot(name)] += 1
+        for key in keys or tuple(self._name_to_keys.get(name, ())):
+            self._pop(name, key)
+
+    def clear(self) -> None:
+        self.versions = [version + 1 for version in self.versions]
+        self._entries.clear()
+        self._name_to_keys.clear()
+        self.size = 0
+
+    def _construct_slot(self, name: str) -> int:
+        return zlib.crc32(name.encode()) % len(self.versions)
+
+    def _pop(self, name: str, key: str) -> None:
+        entry = self._entries.pop((name, key), None)
+        if entry is None:
+            return
+        self.size -= len(entry[1])
+        keys = self._name_to_keys[name]
+        keys.discard(key)
+        if not keys:
+            del self._name_to_keys[name]
+
+
+@contextmanager
+def observe_command(command: str) -> Iterator[None]:
+    with REDIS_LATENCY.labels(command=command).time():
+        yield
+
+
+# The lock is only released by the holder of its token, never after it expired and was taken by someone else.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class CacheEntry(NamedTuple):
+    name: str
+    key: str
+    value: bytes
+    tags: tuple[str, ...] = ()
 
 
 class RedisCache:
     redis_connection: aioredis.Redis  = aioredis.from_url(settings.redis_cache.url)
+    local_cache: LocalCache | None = LocalCache(
+        settings.redis_cache.local_cache_max_entries,
+        settings.redis_cache.local_cache_max_bytes,
+        settings.redis_cache.local_cache_ttl,
+    ) if settings.redis_cache.local_cache_enabled else None
+
+    @classmethod
+    async def hset(cls, name: str, key: str, value: bytes, tags: tuple[str, ...] = ()) -> None:
+        await cls.hset_many((CacheEntry(name, key, value, tags),))
+
+    @classmethod
+    async def hset_many(cls,
+                        entries: Iterable[CacheEntry],
+                        deleted: Iterable[tuple[str, tuple[str, ...]]] = ()) -> None:
+        await cls._write(entries, tuple(deleted), publish=True)
 
     @classmethod
-    async def hset(cls, name: str, key: str, value: bytes) -> None:
-        await cls.redis_connection.hset(name, key=key, value=value)
-        await cls.redis_connection.expire(name, settings.redis_cache.ttl)
+    async def fill(cls, entries: Iterable[CacheEntry]) -> None:
+        # Values read from the database after a miss, nothing changed, so no process has anything to drop.
+        await cls._write(entries, (), publish=False)
+
+    @classmethod
+    async def _write(cls,
+                     entries: Iterable[CacheEntry],
+                     deleted: tuple[tuple[str, tuple[str, ...]], ...],
+                     publish: bool) -> None:
+        name_to_mapping, tag_to_names = defaultdict(dict), defaultdict(set)
+        for entry in entries:
+            name_to_mapping[entry.name][entry.key] = entry.value
+            for tag in entry.tags:
+                tag_to_names[tag].add(entry.name)
+
+        async with cls.redis_connection.pipeline(transaction=False) as pipeline:
+            for name, keys in deleted:
+                pipeline.hdel(name, *keys) if keys else pipeline.delete(name)
+            for name, mapping in name_to_mapping.items():
+                pipeline.hset(name, mapping=mapping)
+                pipeline.expire(name, settings.redis_cache.ttl)
+            for tag, names in tag_to_names.items():
+                pipeline.sadd(tag, *names)
+                pipeline.expire(tag, settings.redis_cache.ttl)
+            if publish:
+                cls._publish_invalidation(
+                    pipeline, *deleted, *((name, tuple(mapping)) for name, mapping in name_to_mapping.items())
+                )
+            with observe_command('hset_many' if publish else 'fill'):
+                await pipeline.execute()
 
     @classmethod
     async def hget(cls, name: str, key: str) -> bytes:
-        return await cls.redis_connection.hget(name, key)
+        value, = await cls.hmget(name, key)
+        return value
+
+    @classmethod
+    async def hmget(cls, name: str, *keys: str) -> list[bytes | None]:
+        return await cls.hget_many(tuple((name, key) for key in keys))
+
+    @classmethod
+    async def hget_many(cls, name_key_pairs: Sequence[tuple[str, str]]) -> list[bytes | None]:
+        if cls.local_cache is None:
+            return await cls._hget_many(name_key_pairs)
+
+        values = [cls.local_cache.get(name, key) for name, key in name_key_pairs]
+        missed = [index for index, value in enumerate(values) if value is None]
+        if not missed:
+            return values
+        versions = [cls.local_cache.get_version(name_key_pairs[index][0]) for index in missed]
+        values_read = await cls._hget_many([name_key_pairs[index] for index in missed])
+        for index, version, value in zip(missed, versions, values_read):
+            if value is not None:
+                cls.local_cache.set(*name_key_pairs[index], value, version)
+            values[index] = value
+        return values
 
     @classmethod
     async def delete(cls, *names: str) -> None:
-        await cls.redis_connection.delete(*names)
+        await cls.delete_many(tuple((name, ()) for name in names))
 
     @classmethod
     async def hdel(cls, name: str, *keys: str) -> None:
-        await cls.redis_connection.hdel(name,*keys)
+        await cls.delete_many(((name, keys),))
+
+    @classmethod
+    async def delete_many(cls, deleted: Iterable[tuple[str, tuple[str, ...]]]) -> None:
+        await cls.hset_many((), deleted)
 
     @classmethod
-    async def get_keys(cls, pattern: str) -> list[str]:
-        return await cls.redis_connection.keys(pattern)
+    async def get_tagged_names(cls, *tags: str) -> list[str]:
+        async with cls.redis_connection.pipeline(transaction=False) as pipeline:
+            for tag in tags:
+                pipeline.smembers(tag)
+            with observe_command('get_tagged_names'):
+                members = await pipeline.execute()
+        return list({name.decode() for names in members for name in names})
+
+    @classmethod
+    async def invalidate_tags(cls, *tags: str) -> None:
+        await cls.delete(*await cls.get_tagged_names(*tags), *tags)
+
+    @classmethod
+    async def listen_invalidation(cls) -> None:
+        while True:
+            try:
+                async with cls.redis_connection.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(settings.redis_cache.invalidation_channel)
+                    # Whatever was published while unsubscribed is lost, so start from an empty cache.
+                    cls.local_cache.clear()
+                    async for message in pubsub.listen():
+                        for name, keys in json.loads(message['data']):
+                            cls.local_cache.invalidate(name, *keys)
+            except Exception:
+                # A lost connection or a message that could not be applied, either way some invalidations are missed.
+                logger.exception('Invalidation listener failed, the local cache is cleared and resubscribed')
+                cls.local_cache.clear()
+                await asyncio.sleep(1)
+
+    @classmethod
+    async def acquire_lock(cls, name: str, ttl_ms: int) -> str | None:
+        token = uuid.uuid4().hex
+        with observe_command('acquire_lock'):
+            acquired = await cls.redis_connection.set(name, token, nx=True, px=ttl_ms)
+        return token if acquired else None
+
+    @classmethod
+    async def release_lock(cls, name: str, token: str) -> bool:
+        with observe_command('release_lock'):
+            return bool(await cls.redis_connection.eval(RELEASE_LOCK_SCRIPT, 1, name, token))
+
+    @classmethod
+    async def close(cls) -> None:
+        # Pooled connections are bound to the event loop that opened them.
+        await cls.redis_connection.connection_pool.disconnect()
+
+    @classmethod
+    async def _hget_many(cls, name_key_pairs: Sequence[tuple[str, str]]) -> list[bytes | None]:
+        names = {name for name, _ in name_key_pairs}
+        if len(names) == 1:
+            with observe_command('hmget'):
+                return await cls.redis_connection.hmget(names.pop(), [key for _, key in name_key_pairs])
+        async with cls.redis_connection.pipeline(transaction=False) as pipeline:
+            for name, key in name_key_pairs:
+                pipeline.hget(name, key)
+            with observe_command('hget_many'):
+                return await pipeline.execute()
+
+    @classmethod
+    def _publish_invalidation(cls, pipeline: Pipeline, *name_to_keys: tuple[str, tuple[str, ...]]) -> None:
+        if cls.local_cache is None or not name_to_keys:
+            return
+        for name, keys in name_to_keys:
+            cls.local_cache.invalidate(name, *keys)
+        pipeline.publish(
+            settings.redis_cache.invalidation_channel,
+            json.dumps([[name, list(keys)] for name, keys in name_to_keys]),
+        )
+
@@ -1,7 +1,7 @@
 from decimal import Decimal
 from typing import Optional, Self
 
-from pydantic import UUID4, BaseModel, Field, ConfigDict, field_validator, model_validator
+from pydantic import UUID4, AliasChoices, BaseModel, Field, ConfigDict, field_validator, model_validator
 
 
 class BaseSchema(BaseModel):
@@ -71,3 +71,31 @@ class DishCreation(DishBase, Identification):
 
 class DishUpdation(DishBase):
     pass
+
+
+class SubmenuTree(BaseSchema, Identification):
+    dishes: list[Dish] = Field(default_factory=list, validation_alias=AliasChoices('dishes', 'dish'))
+
+
+class MenuTree(BaseSchema, Identification):
+    submenus: list[SubmenuTree] = Field(default_factory=list, validation_alias=AliasChoices('submenus', 'submenu'))
+
+
+class DishSync(DishBase):
+    id: UUID4
+
+
+class SubmenuSync(BaseSchema):
+    id: UUID4
+    dishes: list[DishSync] = Field(default_factory=list)
+
+
+class MenuSync(BaseSchema):
+    id: UUID4
+    submenus: list[SubmenuSync] = Field(default_factory=list)
+
+
+class SyncReport(BaseModel):
+    inserted: dict[str, int]
+    updated: dict[str, int]
+    deleted: dict[str, int]
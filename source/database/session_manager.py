@@ -1,3 +1,7 @@
+import logging
+from time import perf_counter
+
+from sqlalchemy import event
 from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
@@ -6,6 +10,7 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from core.config import settings
+from core.metrics import DB_POOL_CONNECTIONS, SQL_LATENCY
 from database.models import Base
 
 
@@ -14,6 +19,97 @@ engine = create_async_engine(url=settings.db.url, pool_pre_ping=True)
 
 sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False)
 
+SQL_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'CREATE', 'DROP', 'COPY'}
+
+EXPLAINED_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'}
+
+# Plain EXPLAIN only plans the statement, so a slow write is not run a second time.
+DIALECT_TO_EXPLAIN = {'postgresql': 'EXPLAIN', 'sqlite': 'EXPLAIN QUERY PLAN'}
+
+slow_query_logger = logging.getLogger('sql.slow')
+
+
+@event.listens_for(engine.sync_engine, 'before_cursor_execute')
+def start_statement(connection, cursor, statement, parameters, context, executemany) -> None:
+    context.statement_started = perf_counter()
+    context.statement_operation = get_statement_operation(statement)
+
+
+@event.listens_for(engine.sync_engine, 'after_cursor_execute')
+def observe_statement(connection, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = perf_counter() - context.statement_started
+    SQL_LATENCY.labels(operation=context.statement_operation).observe(elapsed)
+    if settings.profiling.slow_query_ms and elapsed * 1000 >= settings.profiling.slow_query_ms:
+        plan = None
+        if settings.profiling.explain_slow_queries and not executemany:
+            plan = explain_statement(connection, statement, parameters, context.statement_operation)
+        slow_query_logger.warning(
+            'Slow query took %.1f ms: %s\nparameters: %r%s',
+            elapsed * 1000, statement, parameters, f'\nplan:\n{plan}' if plan else '',
+        )
+
+
+def explain_statement(connection, statement: str, parameters, operation: str) -> str | None:
+    explain = DIALECT_TO_EXPLAIN.get(connection.dialect.name)
+    if explain is None or operation not in EXPLAINED_OPERATIONS:
+        return None
+    # A raw cursor of the same connection sees the same transaction and does not fire the events again.
+    # The savepoint keeps a failed EXPLAIN from aborting the transaction of the request.
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute('SAVEPOINT explain_slow_query')
+        try:
+            cursor.execute(f'{explain} {statement}', parameters)
+            plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+        except Exception as error:
+            cursor.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+            plan = f'EXPLAIN failed: {error}'
+        cursor.execute('RELEASE SAVEPOINT explain_slow_query')
+        return plan
+    finally:
+        cursor.close()
+
+
+def get_statement_operation(statement: str) -> str:
+    operation = statement.split(None, 1)[0].upper() if statement.strip() else ''
+    return operation if operation in SQL_OPERATIONS else 'OTHER'
+
+
+# The gauges are set from the connections of this process rather than counted up and down, so an event without
+# its pair, like the checkin of a checkout that failed its pre-ping, cannot skew them.
+state_to_connections: dict[str, set[int]] = {'open': set(), 'checkedout': set()}
+
+
+def observe_pool(state: str, connection: object, opened: bool) -> None:
+    connections = state_to_connections[state]
+    connections.add(id(connection)) if opened else connections.discard(id(connection))
+    DB_POOL_CONNECTIONS.labels(state=state).set(len(connections))
+
+
+@event.listens_for(engine.sync_engine, 'connect')
+def observe_connect(dbapi_connection, connection_record) -> None:
+    observe_pool('open', dbapi_connection, True)
+
+
+@event.listens_for(engine.sync_engine, 'close')
+def observe_close(dbapi_connection, connection_record) -> None:
+    observe_pool('open', dbapi_connection, False)
+
+
+@event.listens_for(engine.sync_engine, 'close_detached')
+def observe_close_detached(dbapi_connection) -> None:
+    observe_pool('open', dbapi_connection, False)
+
+
+@event.listens_for(engine.sync_engine, 'checkout')
+def observe_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    observe_pool('checkedout', connection_record, True)
+
+
+@event.listens_for(engine.sync_engine, 'checkin')
+def observe_checkin(dbapi_connection, connection_record) -> None:
+    observe_pool('checkedout', connection_record, False)
+
 
 async def get_session() -> AsyncSession:
     async with sessionmaker() as session:
@@ -1,19 +1,34 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 import uvicorn
 from fastapi import FastAPI
 
 from core.config import settings
-from database.session_manager import close_engine
+from core.metrics import MetricsMiddleware, close_metrics
+from core.profiling import ProfilingMiddleware
+from core.tracing import close_tracing, instrument_app, setup_tracing
+from database.redis_cache import RedisCache
+from database.session_manager import close_engine, engine
 from router.dish_router import dish_router
 from router.menu_router import menu_router
+from router.metrics_router import metrics_router
 from router.submenu_router import submenu_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    invalidation_listener = None
+    if RedisCache.local_cache is not None:
+        invalidation_listener = asyncio.create_task(RedisCache.listen_invalidation())
     yield
+    if invalidation_listener is not None:
+        invalidation_listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await invalidation_listener
     await close_engine()
+    close_tracing()
+    close_metrics()
 
 app = FastAPI(lifespan=lifespan,
               title='Restaurant API',
@@ -41,6 +56,22 @@ app.include_router(menu_router)
 app.include_router(submenu_router)
 app.include_router(dish_router)
 
+if settings.metrics.enabled:
+    app.include_router(metrics_router)
+    app.add_middleware(MetricsMiddleware, skipped_paths=(settings.url.target_metrics,))
+
+setup_tracing(engine)
+instrument_app(app, skipped_paths=(settings.url.target_metrics,))
+
+if settings.profiling.enabled:
+    app.add_middleware(
+        ProfilingMiddleware,
+        header=settings.profiling.header,
+        token=settings.profiling.token,
+        directory=settings.profiling.directory,
+        top_functions=settings.profiling.top_functions,
+    )
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+"""Denormalized counters
+
+Revision ID: 3b7c1e9d4a52
+Revises: 69f9a6b342fb
+Create Date: 2026-10-17 09:00:12.418304
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7c1e9d4a52'
+down_revision: Union[str, None] = '69f9a6b342fb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('menu', sa.Column('submenus_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('menu', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('submenu', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("""
+        UPDATE submenu
+        SET dishes_count = (SELECT count(*) FROM dish WHERE dish.submenu_id = submenu.id)
+    """)
+    op.execute("""
+        UPDATE menu
+        SET submenus_count = (SELECT count(*) FROM submenu WHERE submenu.menu_id = menu.id),
+            dishes_count = (SELECT coalesce(sum(dishes_count), 0) FROM submenu WHERE submenu.menu_id = menu.id)
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION submenu_counters() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE menu
+                SET submenus_count = submenus_count - 1, dishes_count = dishes_count - OLD.dishes_count
+                WHERE id = OLD.menu_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE menu
+                SET submenus_count = submenus_count + 1, dishes_count = dishes_count + NEW.dishes_count
+                WHERE id = NEW.menu_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION dish_counters() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE submenu SET dishes_count = dishes_count - 1 WHERE id = OLD.submenu_id;
+                UPDATE menu SET dishes_count = menu.dishes_count - 1
+                FROM submenu WHERE submenu.id = OLD.submenu_id AND menu.id = submenu.menu_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE submenu SET dishes_count = dishes_count + 1 WHERE id = NEW.submenu_id;
+                UPDATE menu SET dishes_count = menu.dishes_count + 1
+                FROM submenu WHERE submenu.id = NEW.submenu_id AND menu.id = submenu.menu_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Rerunnable against a schema that create_all already gave the triggers.
+    op.execute('DROP TRIGGER IF EXISTS submenu_counters ON submenu')
+    op.execute("""
+        CREATE TRIGGER submenu_counters AFTER INSERT OR DELETE OR UPDATE OF menu_id ON submenu
+        FOR EACH ROW EXECUTE FUNCTION submenu_counters()
+    """)
+    op.execute('DROP TRIGGER IF EXISTS dish_counters ON dish')
+    op.execute("""
+        CREATE TRIGGER dish_counters AFTER INSERT OR DELETE OR UPDATE OF submenu_id ON dish
+        FOR EACH ROW EXECUTE FUNCTION dish_counters()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS dish_counters ON dish')
+    op.execute('DROP TRIGGER IF EXISTS submenu_counters ON submenu')
+    op.execute('DROP FUNCTION IF EXISTS dish_counters()')
+    op.execute('DROP FUNCTION IF EXISTS submenu_counters()')
+    op.drop_column('submenu', 'dishes_count')
+    op.drop_column('menu', 'dishes_count')
+    op.drop_column('menu', 'submenus_count')
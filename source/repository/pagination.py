@@ -0,0 +1,66 @@
+import base64
+import binascii
+import json
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+
+from core.config import settings
+
+
+@dataclass
+class Page:
+    limit: int = settings.page.default_limit
+    cursor: str | None = None
+    sort: str = 'title'
+    order: str = 'asc'
+    price_min: Decimal | None = None
+    price_max: Decimal | None = None
+
+    @property
+    def descending(self) -> bool:
+        return self.order == 'desc'
+
+    @property
+    def has_filters(self) -> bool:
+        return self.price_min is not None or self.price_max is not None
+
+    @property
+    def number(self) -> int:
+        return self.decode_cursor()[0] if self.cursor else 0
+
+    @property
+    def cache_key(self) -> str:
+        return f'{self.sort}:{self.order}:{self.limit}:{self.cursor or ""}'
+
+    def decode_cursor(self) -> tuple[int, str | Decimal, uuid.UUID]:
+        # Cursors come back from clients, every part is checked before it reaches the query or the cache.
+        try:
+            number, sort, order, value, entity_id = json.loads(base64.urlsafe_b64decode(self.cursor))
+            if type(number) is not int or number < 0 or not isinstance(value, str):
+                raise ValueError('invalid cursor')
+            if sort == 'price' and not (value := Decimal(value)).is_finite():
+                raise ValueError('invalid cursor')
+            entity_id = uuid.UUID(entity_id)
+        except (binascii.Error, TypeError, ValueError, AttributeError, ArithmeticError):
+            raise ValueError('invalid cursor')
+        if (sort, order) != (self.sort, self.order):
+            raise ValueError('cursor was issued for a different sort order')
+        return number, value, entity_id
+
+    def encode_cursor(self, value: str | Decimal, entity_id: str) -> str:
+        payload = json.dumps([self.number + 1, self.sort, self.order, str(value), str(entity_id)])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    @classmethod
+    def from_query(cls,
+                   limit: int | None,
+                   cursor: str | None,
+                   sort: str = 'title',
+                   order: str = 'asc',
+                   price_min: Decimal | None = None,
+                   price_max: Decimal | None = None) -> 'Page | None':
+        # Without any paging parameter the route keeps returning the whole unordered list.
+        if limit is None and cursor is None and (sort, order, price_min, price_max) == ('title', 'asc', None, None):
+            return None
+        return cls(limit or settings.page.default_limit, cursor, sort, order, price_min, price_max)
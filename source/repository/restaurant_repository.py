@@ -1,16 +1,39 @@
+import uuid
+from dataclasses import dataclass, field
 from typing import Any, Annotated
 
 from fastapi import Depends
-from sqlalchemy import delete, select
+from sqlalchemy import ColumnElement, Select, and_, delete, func, literal, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 
-from database.models import Base
+from core.config import settings
+from core.tracing import trace_methods, tracer
+from database.models import Base, Dish, Menu, Submenu
 from database.session_manager import get_session
+from repository.pagination import Page
 
 
-# from sqlalchemy.dialects.postgresql import insert
+# Parents go first: rows are upserted in this order and deleted in the reverse one.
+SYNC_TABLE_TO_COLUMNS = {
+    Menu.__tablename__: ('id', 'title', 'description'),
+    Submenu.__tablename__: ('id', 'title', 'description', 'menu_id'),
+    Dish.__tablename__: ('id', 'title', 'description', 'price', 'discount', 'submenu_id'),
+}
 
+SYNC_UUID_COLUMNS = ('id', 'menu_id', 'submenu_id')
 
+
+@dataclass
+class SyncResult:
+    inserted: dict[str, int] = field(default_factory=dict)
+    updated: dict[str, int] = field(default_factory=dict)
+    deleted: dict[str, int] = field(default_factory=dict)
+    deleted_menu_ids: list[str] = field(default_factory=list)
+
+
+@trace_methods
 class RestaurantRepository:
     def __init__(self, session: Annotated[AsyncSession, Depends(get_session)]) -> None:
         self._session = session
@@ -19,8 +42,10 @@ class RestaurantRepository:
         entity = entity_type(**kwargs)
         async with self._session as session:
             session.add(entity)
-            await session.commit()
-            await session.refresh(entity)
+            with tracer.start_as_current_span('session.commit'):
+                await session.commit()
+            with tracer.start_as_current_span('session.refresh'):
+                await session.refresh(entity)
             return entity
 
     async def get_entity_by_id(self, entity_type: type[Base], entity_id: str) -> Base | None:
@@ -28,26 +53,131 @@ class RestaurantRepository:
             return await session.get(entity_type, entity_id)
 
     async def get_entities(self, entity_type: type[Base], **kwargs: str) -> list[Base] | list[None]:
-        select_entity = select(entity_type)
-        if kwargs:
-            where_clause = [getattr(entity_type, name) == value for name, value in kwargs.items()]
-            select_entity = select_entity.where(*where_clause)
+        select_entity = self._filter_by_relation(select(entity_type), entity_type, **kwargs)
         async with self._session as session:
             return (await session.scalars(select_entity)).all()
 
+    async def get_page(self, entity_type: type[Base], page: Page, **kwargs: str) -> tuple[list[Base], str | None]:
+        sort_column = self._construct_sort_column(entity_type, page.sort)
+        select_entity = self._filter_by_relation(select(entity_type, sort_column), entity_type, **kwargs)
+        if page.price_min is not None:
+            select_entity = select_entity.where(self._construct_sort_column(entity_type, 'price') >= page.price_min)
+        if page.price_max is not None:
+            select_entity = select_entity.where(self._construct_sort_column(entity_type, 'price') <= page.price_max)
+        if page.cursor:
+            _, value, entity_id = page.decode_cursor()
+            keyset = tuple_(sort_column, entity_type.id)
+            cursor = tuple_(literal(value, sort_column.type), literal(entity_id, entity_type.id.type))
+            select_entity = select_entity.where(keyset < cursor if page.descending else keyset > cursor)
+        order_by = (sort_column.desc(), entity_type.id.desc()) if page.descending else (sort_column, entity_type.id)
+        select_entity = select_entity.order_by(*order_by).limit(page.limit + 1)
+        async with self._session as session:
+            rows = (await session.execute(select_entity)).all()
+        if len(rows) <= page.limit:
+            return [entity for entity, _ in rows], None
+        entity, value = rows[page.limit - 1]
+        return [entity for entity, _ in rows[:page.limit]], page.encode_cursor(value, entity.id)
+
+    async def get_menu_tree(self) -> list[Menu] | list[None]:
+        select_tree = select(Menu).options(joinedload(Menu.submenu).selectinload(Submenu.dish))
+        async with self._session as session:
+            return (await session.scalars(select_tree)).unique().all()
+
+    async def upsert_entities(self, entity_type: type[Base], rows: list[dict], **kwargs: str) -> list[Base]:
+        entities = []
+        async with self._session as session:
+            for start in range(0, len(rows), settings.bulk.chunk_size):
+                chunk = [{**row, **kwargs} for row in rows[start:start + settings.bulk.chunk_size]]
+                statement = insert(entity_type).values(chunk)
+                # A row that already belongs to another parent is left alone instead of being moved.
+                parent_clause = [getattr(entity_type, name) == statement.excluded[name] for name in kwargs]
+                statement = statement.on_conflict_do_update(
+                    index_elements=[entity_type.id],
+                    set_={column: statement.excluded[column] for column in chunk[0] if column != 'id'},
+                    where=and_(*parent_clause) if parent_clause else None,
+                ).returning(entity_type)
+                result = await session.scalars(statement, execution_options={'populate_existing': True})
+                entities.extend(result.all())
+            with tracer.start_as_current_span('session.commit'):
+                await session.commit()
+        return entities
+
+    async def sync_catalog(self, table_to_rows: dict[str, list[dict]]) -> SyncResult:
+        result = SyncResult()
+        async with self._session as session:
+            connection = await session.connection()
+            driver_connection = (await connection.get_raw_connection()).driver_connection
+            for table, columns in SYNC_TABLE_TO_COLUMNS.items():
+                await session.execute(
+                    text(f'CREATE TEMP TABLE {table}_stage (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+                )
+                records = [self._construct_sync_record(row, columns) for row in table_to_rows.get(table, ())]
+                await driver_connection.copy_records_to_table(f'{table}_stage', records=records, columns=columns)
+
+            for table in reversed(SYNC_TABLE_TO_COLUMNS):
+                deleted_ids = (await session.scalars(text(
+                    f'DELETE FROM {table} WHERE NOT EXISTS '
+                    f'(SELECT 1 FROM {table}_stage AS stage WHERE stage.id = {table}.id) RETURNING id'
+                ))).all()
+                result.deleted[table] = len(deleted_ids)
+                if table == Menu.__tablename__:
+                    result.deleted_menu_ids = [str(entity_id) for entity_id in deleted_ids]
+
+            for table, columns in SYNC_TABLE_TO_COLUMNS.items():
+                inserted = (await session.scalars(text(self._construct_sync_upsert(table, columns)))).all()
+                result.inserted[table] = sum(inserted)
+                result.updated[table] = len(inserted) - result.inserted[table]
+            with tracer.start_as_current_span('session.commit'):
+                await session.commit()
+        return result
+
     async def update_entity(self, entity_type: type[Base], entity_id: str, **kwargs: Any) -> Base | None:
-        # statement = insert(entity_type).values(**entity.as_dict).on_conflict_do_update
         async with self._session as session:
             entity = await session.get(entity_type, entity_id)
             if entity is None:
                 return
             for column_name, value in kwargs.items(): setattr(entity, column_name, value)
-            await session.commit()
-            await session.refresh(entity)
+            with tracer.start_as_current_span('session.commit'):
+                await session.commit()
+            with tracer.start_as_current_span('session.refresh'):
+                await session.refresh(entity)
             return entity
 
     async def delete_entity(self, entity_type: type[Base], entity_id: str) -> None:
         statement = delete(entity_type).where(entity_type.id == entity_id)
         async with self._session as session:
             await session.execute(statement)
-            await session.commit()
+            with tracer.start_as_current_span('session.commit'):
+                await session.commit()
+
+    @staticmethod
+    def _filter_by_relation(select_entity: Select, entity_type: type[Base], **kwargs: str) -> Select:
+        if kwargs:
+            where_clause = [getattr(entity_type, name) == value for name, value in kwargs.items()]
+            select_entity = select_entity.where(*where_clause)
+        return select_entity
+
+    @staticmethod
+    def _construct_sort_column(entity_type: type[Base], sort: str) -> ColumnElement:
+        # Dishes are sorted and filtered by the discounted price the client actually sees.
+        if sort == 'price':
+            return entity_type.price * (100 - func.coalesce(entity_type.discount, 0)) / 100
+        return getattr(entity_type, sort)
+
+    @staticmethod
+    def _construct_sync_record(row: dict, columns: tuple[str, ...]) -> tuple:
+        return tuple(
+            uuid.UUID(str(row[column])) if column in SYNC_UUID_COLUMNS else row[column] for column in columns
+        )
+
+    @staticmethod
+    def _construct_sync_upsert(table: str, columns: tuple[str, ...]) -> str:
+        # Rows equal to the staged ones are not rewritten, and xmax = 0 tells inserted rows from updated ones.
+        updated_columns = [column for column in columns if column != 'id']
+        return (
+            f'INSERT INTO {table} ({", ".join(columns)}) SELECT {", ".join(columns)} FROM {table}_stage '
+            f'ON CONFLICT (id) DO UPDATE SET {", ".join(f"{column} = EXCLUDED.{column}" for column in updated_columns)} '
+            f'WHERE ({", ".join(f"{table}.{column}" for column in updated_columns)}) IS DISTINCT FROM '
+            f'({", ".join(f"EXCLUDED.{column}" for column in updated_columns)}) '
+            f'RETURNING xmax = 0'
+        )
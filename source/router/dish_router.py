@@ -1,9 +1,11 @@
-from typing import Annotated
+from decimal import Decimal
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body, Query, Response, status
 
 from core.config import settings
 from database.schemas import Dish, DishCreation, DishUpdation
+from repository.pagination import Page
 from service.restaurant_service import RestaurantService, TargetCode
 
 
@@ -30,15 +32,41 @@ async def create(target_menu_id: str,
     except Exception as error:
         raise HTTPException(status_code=400, detail=error.args[0])
 
+@dish_router.post(path.target_bulk, name='Upsert dishes', status_code=status.HTTP_200_OK, response_model=list[Dish])
+async def bulk_upsert(target_menu_id: str,
+                      target_submenu_id: str,
+                      schemas: Annotated[list[DishCreation], Body(max_length=settings.bulk.max_size)],
+                      task: BackgroundTasks,
+                      service: RestaurantService):
+    target = TargetCode.get_target(tag_dish)
+    target.menu_id = target_menu_id
+    target.submenu_id = target_submenu_id
+    try:
+        return await service.bulk_upsert(schemas, target, task)
+    except Exception as error:
+        raise HTTPException(status_code=400, detail=error.args[0])
+
 @dish_router.get('', name='Get all dish', status_code=status.HTTP_200_OK, response_model=list[Dish])
 async def read_all(target_menu_id: str,
                    target_submenu_id: str,
                    task: BackgroundTasks,
-                   service: RestaurantService):
+                   service: RestaurantService,
+                   limit: Annotated[int | None, Query(ge=1, le=settings.page.max_limit)] = None,
+                   cursor: str | None = None,
+                   sort: Literal['title', 'price'] = 'title',
+                   order: Literal['asc', 'desc'] = 'asc',
+                   price_min: Annotated[Decimal | None, Query(ge=0)] = None,
+                   price_max: Annotated[Decimal | None, Query(ge=0)] = None):
     target = TargetCode.get_target(tag_dish)
     target.menu_id = target_menu_id
     target.submenu_id = target_submenu_id
-    return await service.read_all(target, task)
+    target.page = Page.from_query(limit, cursor, sort, order, price_min, price_max)
+    try:
+        content, next_cursor = await service.read_all(target, task)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=error.args[0])
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return Response(content=content, media_type='application/json', headers=headers)
 
 @dish_router.get(path.target_dish_id, name='Get one dish', status_code=status.HTTP_200_OK, response_model=Dish)
 async def read_one(target_menu_id: str,
@@ -51,7 +79,7 @@ async def read_one(target_menu_id: str,
     target.submenu_id = target_submenu_id
     target.dish_id = target_dish_id
     try:
-        return await service.read_one(target, task)
+        return Response(content=await service.read_one(target, task), media_type='application/json')
     except ValueError as error:
         raise HTTPException(status_code=404, detail=error.args[0])
 
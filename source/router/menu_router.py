@@ -1,9 +1,10 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body, Query, Response, status
 
 from core.config import settings
-from database.schemas import Menu, MenuCreation, MenuUpdation
+from database.schemas import Menu, MenuCreation, MenuSync, MenuTree, MenuUpdation, SyncReport
+from repository.pagination import Page
 from service.restaurant_service import TargetCode, RestaurantService
 
 
@@ -24,17 +25,49 @@ async def create(schema: MenuCreation, task: BackgroundTasks, service: Restauran
     except Exception as error:
         raise HTTPException(status_code=400, detail=error.args[0])
 
+@menu_router.post(path.target_bulk, name='Upsert menus', status_code=status.HTTP_200_OK, response_model=list[Menu])
+async def bulk_upsert(schemas: Annotated[list[MenuCreation], Body(max_length=settings.bulk.max_size)],
+                      task: BackgroundTasks,
+                      service: RestaurantService):
+    target = TargetCode.get_target(tag_menu)
+    try:
+        return await service.bulk_upsert(schemas, target, task)
+    except Exception as error:
+        raise HTTPException(status_code=400, detail=error.args[0])
+
+@menu_router.put(path.target_sync, name='Sync menu tree', status_code=status.HTTP_200_OK, response_model=SyncReport)
+async def sync_tree(menus: list[MenuSync], service: RestaurantService):
+    try:
+        return await service.sync_tree(menus)
+    except Exception as error:
+        raise HTTPException(status_code=400, detail=error.args[0])
+
 @menu_router.get('', name='Get all menu', status_code=status.HTTP_200_OK, response_model=list[Menu])
-async def read_all(task: BackgroundTasks, service: RestaurantService):
+async def read_all(task: BackgroundTasks,
+                   service: RestaurantService,
+                   limit: Annotated[int | None, Query(ge=1, le=settings.page.max_limit)] = None,
+                   cursor: str | None = None,
+                   sort: Literal['title'] = 'title',
+                   order: Literal['asc', 'desc'] = 'asc'):
     target = TargetCode.get_target(tag_menu)
-    return await service.read_all(target, task)
+    target.page = Page.from_query(limit, cursor, sort, order)
+    try:
+        content, next_cursor = await service.read_all(target, task)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=error.args[0])
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return Response(content=content, media_type='application/json', headers=headers)
+
+@menu_router.get(path.target_tree, name='Get menu tree', status_code=status.HTTP_200_OK, response_model=list[MenuTree])
+async def read_tree(task: BackgroundTasks, service: RestaurantService):
+    return Response(content=await service.read_tree(task), media_type='application/json')
 
 @menu_router.get(path.target_menu_id, name='Get one menu', status_code=status.HTTP_200_OK, response_model=Menu)
 async def read_one(target_menu_id: str, task: BackgroundTasks, service: RestaurantService):
     target = TargetCode.get_target(tag_menu)
     target.menu_id = target_menu_id
     try:
-        return await service.read_one(target, task)
+        return Response(content=await service.read_one(target, task), media_type='application/json')
     except ValueError as error:
         raise HTTPException(status_code=404, detail=error.args[0])
 
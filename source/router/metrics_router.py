@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from core.config import settings
+from core.metrics import render_metrics
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get(settings.url.target_metrics, name='Get metrics', include_in_schema=False)
+async def read_metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
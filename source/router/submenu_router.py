@@ -1,9 +1,10 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body, Query, Response, status
 
 from core.config import settings
 from database.schemas import Submenu, SubmenuCreation, SubmenuUpdation
+from repository.pagination import Page
 from service.restaurant_service import RestaurantService, TargetCode
 
 
@@ -28,11 +29,38 @@ async def create(target_menu_id: str,
     except Exception as error:
         raise HTTPException(status_code=400, detail=error.args[0])
 
+@submenu_router.post(path.target_bulk,
+                     name='Upsert submenus',
+                     status_code=status.HTTP_200_OK,
+                     response_model=list[Submenu])
+async def bulk_upsert(target_menu_id: str,
+                      schemas: Annotated[list[SubmenuCreation], Body(max_length=settings.bulk.max_size)],
+                      task: BackgroundTasks,
+                      service: RestaurantService):
+    target = TargetCode.get_target(tag_submenu)
+    target.menu_id = target_menu_id
+    try:
+        return await service.bulk_upsert(schemas, target, task)
+    except Exception as error:
+        raise HTTPException(status_code=400, detail=error.args[0])
+
 @submenu_router.get('', name='Get all submenu', status_code=status.HTTP_200_OK, response_model=list[Submenu])
-async def read_all(target_menu_id: str, task: BackgroundTasks, service: RestaurantService):
+async def read_all(target_menu_id: str,
+                   task: BackgroundTasks,
+                   service: RestaurantService,
+                   limit: Annotated[int | None, Query(ge=1, le=settings.page.max_limit)] = None,
+                   cursor: str | None = None,
+                   sort: Literal['title'] = 'title',
+                   order: Literal['asc', 'desc'] = 'asc'):
     target = TargetCode.get_target(tag_submenu)
     target.menu_id = target_menu_id
-    return await service.read_all(target, task)
+    target.page = Page.from_query(limit, cursor, sort, order)
+    try:
+        content, next_cursor = await service.read_all(target, task)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=error.args[0])
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return Response(content=content, media_type='application/json', headers=headers)
 
 @submenu_router.get(path.target_submenu_id, name='Get one submenu', status_code=200, response_model=Submenu)
 async def read_one(target_menu_id: str,
@@ -43,7 +71,7 @@ async def read_one(target_menu_id: str,
     target.menu_id = target_menu_id
     target.submenu_id = target_submenu_id
     try:
-        return await service.read_one(target, task)
+        return Response(content=await service.read_one(target, task), media_type='application/json')
     except ValueError as error:
         raise HTTPException(status_code=404, detail=error.args[0])
 
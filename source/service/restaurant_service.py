@@ -1,14 +1,20 @@
-import pickle
-from dataclasses import dataclass, fields
+import uuid
+from dataclasses import dataclass, fields, replace
 from enum import Enum
 from typing import Annotated
 
 from fastapi import BackgroundTasks, Depends
 
+from core.config import settings
+from core.metrics import CACHE_REQUESTS, track_task
+from core.tracing import trace_methods
+from database import schemas
+from database.cache_serializer import CacheSerializer
 from database.models import Menu, Submenu, Dish, Base
-from database.redis_cache import RedisCache
-from database.schemas import BaseSchema
-from repository.restaurant_repository import RestaurantRepository
+from database.redis_cache import PAGE_CACHE_SUFFIX, TREE_CACHE_KEY, CacheEntry, RedisCache, construct_cache_labels
+from database.schemas import BaseSchema, MenuSync, MenuTree
+from repository.pagination import Page
+from repository.restaurant_repository import RestaurantRepository, SyncResult
 
 
 class Entity(Enum):
@@ -19,6 +25,20 @@ class Entity(Enum):
 
 ENTITY_NAME_TO_ENTITY_TYPE = {entity.value.__name__: entity.value for entity in Entity}
 
+ENTITY_NAME_TO_SCHEMA = {
+    Menu.__name__: schemas.Menu,
+    Submenu.__name__: schemas.Submenu,
+    Dish.__name__: schemas.Dish,
+}
+
+ENTITY_NAME_TO_SERIALIZER = {name: CacheSerializer(schema) for name, schema in ENTITY_NAME_TO_SCHEMA.items()}
+
+ENTITY_NAME_TO_LIST_SERIALIZER = {
+    name: CacheSerializer(list[schema]) for name, schema in ENTITY_NAME_TO_SCHEMA.items()
+}
+
+TREE_SERIALIZER = CacheSerializer(list[MenuTree])
+
 
 @dataclass
 class TargetCode:
@@ -28,6 +48,7 @@ class TargetCode:
     dish_id: str = ''
     entity: Base | None = None
     kwargs: dict | None = None
+    page: Page | None = None
 
     @property
     def get_entity_id(self) -> str:
@@ -38,6 +59,7 @@ class TargetCode:
         return cls(tag)
 
 
+@trace_methods
 class RestaurantService:
     def __init__(self,
                  repository: Annotated[RestaurantRepository, Depends(RestaurantRepository)],
@@ -55,20 +77,58 @@ class RestaurantService:
 
         entity = await self.repository.create_entity(entity_type, **schema_as_dict)
         target_code.entity = entity
-        task.add_task(self.set_cache, target_code)
+        task.add_task(track_task(self.set_cache), target_code)
         return entity
 
-    async def read_one(self, target_code: TargetCode, task: BackgroundTasks) -> Base:
+    async def bulk_upsert(self,
+                          schemas: list[BaseSchema],
+                          target_code: TargetCode,
+                          task: BackgroundTasks) -> list[Base]:
+        entity_type, _, _ = self._construct_entity_param(target_code)
+        kwargs = self._get_relation_column_name_to_value(target_code, entity_type)
+        id_to_row = {}
+        for schema in schemas:
+            row = schema.model_dump()
+            row['id'] = str(row['id'] or uuid.uuid4())
+            id_to_row[row['id']] = row
+
+        entities = await self.repository.upsert_entities(entity_type, list(id_to_row.values()), **kwargs)
+        task.add_task(track_task(self.bulk_update_cache), target_code)
+        return entities
+
+    async def sync_tree(self, menus: list[MenuSync]) -> SyncResult:
+        table_to_rows = {Menu.__tablename__: [], Submenu.__tablename__: [], Dish.__tablename__: []}
+        for menu in menus:
+            table_to_rows[Menu.__tablename__].append(menu.model_dump(exclude={'submenus'}))
+            for submenu in menu.submenus:
+                table_to_rows[Submenu.__tablename__].append(
+                    {**submenu.model_dump(exclude={'dishes'}), 'menu_id': menu.id}
+                )
+                table_to_rows[Dish.__tablename__].extend(
+                    {**dish.model_dump(), 'submenu_id': submenu.id} for dish in submenu.dishes
+                )
+        return await self.sync_catalog(table_to_rows)
+
+    async def sync_catalog(self, table_to_rows: dict[str, list[dict]]) -> SyncResult:
+        result = await self.repository.sync_catalog(table_to_rows)
+        menu_ids = {str(row['id']) for row in table_to_rows.get(Menu.__tablename__, ())}
+        await self.delete_catalog_cache(menu_ids.union(result.deleted_menu_ids))
+        return result
+
+    async def read_one(self, target_code: TargetCode, task: BackgroundTasks) -> bytes:
         entity_type, entity_name, entity_id = self._construct_entity_param(target_code)
         cache_name = self._construct_cache_name(entity_name, target_code)
-        if cache := await self.get_cache(entity_id, cache_name):
+        serializer = ENTITY_NAME_TO_SERIALIZER[entity_name]
+        if cache := await self.get_cache(entity_id, cache_name, serializer):
             return cache
 
         if not (entity := await self.repository.get_entity_by_id(entity_type, entity_id)):
             raise ValueError(f'{entity_name.lower()} not found')
 
-        task.add_task(self._set_cache, entity_id, entity, cache_name)
-        return entity
+        value_serialized = serializer.dumps(entity)
+        tags = self._construct_cache_tags(entity_name, target_code)
+        task.add_task(track_task(self.cache.fill), [CacheEntry(cache_name, entity_id, value_serialized, tags)])
+        return serializer.loads(value_serialized)
 
     async def update(self, schema: BaseSchema, target_code: TargetCode, task: BackgroundTasks) -> Base | None:
         entity_type, entity_name, entity_id = self._construct_entity_param(target_code)
@@ -80,55 +140,121 @@ class RestaurantService:
             raise ValueError(f'{entity_name.lower()} not found')
 
         target_code.entity = entity
-        task.add_task(self.update_cache, target_code)
+        task.add_task(track_task(self.update_cache), target_code)
         return entity
 
     async def delete(self, target_code: TargetCode, task: BackgroundTasks) -> None:
         entity_type, _, entity_id = self._construct_entity_param(target_code)
         await self.repository.delete_entity(entity_type, entity_id)
-        task.add_task(self.delete_cache, target_code)
+        task.add_task(track_task(self.delete_cache), target_code)
+
+    async def read_all(self, target_code: TargetCode, task: BackgroundTasks) -> tuple[bytes, str | None]:
+        if target_code.page is not None:
+            return await self.read_page(target_code, task)
 
-    async def read_all(self, target_code: TargetCode, task: BackgroundTasks) -> list[Base] | None:
         entity_type, entity_name, _ = self._construct_entity_param(target_code)
         cache_name = self._construct_cache_name(entity_name, target_code)
-        if cache := await self.get_cache(entity_name, cache_name):
-            return cache
+        serializer = ENTITY_NAME_TO_LIST_SERIALIZER[entity_name]
+        if cache := await self.get_cache(entity_name, cache_name, serializer):
+            return cache, None
 
         kwargs = self._get_relation_column_name_to_value(target_code, entity_type)
         entities =  await self.repository.get_entities(entity_type, **kwargs)
+        value_serialized = serializer.dumps(entities)
         if entities:
-            task.add_task(self._set_cache, entity_name, entities, cache_name)
-        return entities
+            tags = self._construct_cache_tags(entity_name, target_code)
+            task.add_task(track_task(self.cache.fill), [CacheEntry(cache_name, entity_name, value_serialized, tags)])
+        return serializer.loads(value_serialized), None
 
-    async def _set_cache(self, key: str, value: Base | list[Base], cache_name: str) -> None:
-        value_serialized = self._serialize_pickle(value)
-        await self.cache.hset(cache_name, key, value_serialized)
+    async def read_page(self, target_code: TargetCode, task: BackgroundTasks) -> tuple[bytes, str | None]:
+        entity_type, entity_name, _ = self._construct_entity_param(target_code)
+        page = target_code.page
+        cache_name = self._construct_cache_name(entity_name, target_code) + PAGE_CACHE_SUFFIX
+        serializer = ENTITY_NAME_TO_LIST_SERIALIZER[entity_name]
+        # Only the first pages of unfiltered listings are cached, which keeps the page hash bounded. The page
+        # number of a cursor is only trusted once a cached page issued it, so forged cursors are never cached.
+        cacheable = not page.has_filters and page.number < settings.redis_cache.max_cached_pages
+        if cacheable:
+            cache_value, next_cursor, issued = await self.cache.hmget(
+                cache_name, page.cache_key, f'{page.cache_key}:next', f'{page.cache_key}:issued'
+            )
+            cacheable = page.cursor is None or issued is not None
+        if cacheable:
+            self._count_cache_request(cache_name, page.cache_key, cache_value)
+            if (cache := serializer.loads(cache_value)) is not None:
+                return cache, (next_cursor or b'').decode() or None
 
-    async def get_cache(self, key: str, cache_name: str,) -> Base | list[Base] | None:
+        kwargs = self._get_relation_column_name_to_value(target_code, entity_type)
+        entities, next_cursor = await self.repository.get_page(entity_type, page, **kwargs)
+        value_serialized = serializer.dumps(entities)
+        if cacheable and entities:
+            tags = self._construct_cache_tags(entity_name, target_code)
+            entries = [
+                CacheEntry(cache_name, page.cache_key, value_serialized, tags),
+                CacheEntry(cache_name, f'{page.cache_key}:next', (next_cursor or '').encode(), tags),
+            ]
+            if next_cursor and page.number + 1 < settings.redis_cache.max_cached_pages:
+                next_page = replace(page, cursor=next_cursor)
+                entries.append(CacheEntry(cache_name, f'{next_page.cache_key}:issued', b'1', tags))
+            task.add_task(track_task(self.cache.fill), entries)
+        return serializer.loads(value_serialized), next_cursor
+
+    async def read_tree(self, task: BackgroundTasks) -> bytes:
+        cache_name = self._construct_cache_name(Menu.__name__, TargetCode.get_target(Menu.__name__))
+        if cache := await self.get_cache(TREE_CACHE_KEY, cache_name, TREE_SERIALIZER):
+            return cache
+
+        menus = await self.repository.get_menu_tree()
+        value_serialized = TREE_SERIALIZER.dumps(menus)
+        task.add_task(track_task(self.cache.fill), [CacheEntry(cache_name, TREE_CACHE_KEY, value_serialized)])
+        return TREE_SERIALIZER.loads(value_serialized)
+
+    async def get_cache(self, key: str, cache_name: str, serializer: CacheSerializer) -> bytes | None:
         cache_value = await self.cache.hget(cache_name, key)
-        return self._deserialize_pickle(cache_value)
+        self._count_cache_request(cache_name, key, cache_value)
+        return serializer.loads(cache_value)
 
     async def delete_cache(self, target_code: TargetCode) -> None:
-        cache_name, keys, pattern = self._construct_param_for_delete_cache(target_code)
-        await self.cache.hdel(cache_name, *keys)
-        keys = await self.cache.get_keys(pattern) if pattern else None
-        await self.cache.delete(*keys) if keys else None
-        await self.set_cache_entities(target_code)
+        cache_name, keys, names, tags = self._construct_param_for_delete_cache(target_code)
+        deleted = [(cache_name, keys), (cache_name + PAGE_CACHE_SUFFIX, ())]
+        deleted.extend((name, ()) for name in (*names, *tags))
+        if tags:
+            deleted.extend((name, ()) for name in await self.cache.get_tagged_names(*tags))
+        await self._write_cache(await self.get_cache_entities(target_code), deleted)
+
+    async def delete_catalog_cache(self, menu_ids: set[str]) -> None:
+        # A whole catalog sync is invalidated at once: the menu hash and everything tagged by any menu.
+        menu_cache_name = self._construct_cache_name(Menu.__name__, TargetCode.get_target(Menu.__name__))
+        tags = [self._construct_menu_tag(menu_id) for menu_id in menu_ids]
+        names = [menu_cache_name, menu_cache_name + PAGE_CACHE_SUFFIX, *tags]
+        if tags:
+            names.extend(await self.cache.get_tagged_names(*tags))
+        await self.cache.delete(*names)
 
     async def set_cache(self, target_code: TargetCode) -> None:
-        cache_name = self._construct_cache_name(target_code.entity_name, target_code)
-        await self._set_cache(str(target_code.entity.id), target_code.entity, cache_name)
-        entity_type = ENTITY_NAME_TO_ENTITY_TYPE[target_code.entity_name]
+        entity_name = target_code.entity_name
+        cache_name = self._construct_cache_name(entity_name, target_code)
+        tags = self._construct_cache_tags(entity_name, target_code)
+        entity_type = ENTITY_NAME_TO_ENTITY_TYPE[entity_name]
         if target_code.kwargs:
             entities = await self.repository.get_entities(entity_type, **target_code.kwargs)
         else:
             entities = await self.repository.get_entities(entity_type)
-        await self._set_cache(target_code.entity_name, entities, cache_name)
-        await self.set_cache_entities(target_code)
+        entries = [
+            self._construct_cache_entry(
+                str(target_code.entity.id), target_code.entity, cache_name, ENTITY_NAME_TO_SERIALIZER[entity_name], tags
+            ),
+            self._construct_cache_entry(
+                entity_name, entities, cache_name, ENTITY_NAME_TO_LIST_SERIALIZER[entity_name], tags
+            ),
+            *await self.get_cache_entities(target_code),
+        ]
+        await self._write_cache(entries)
 
     async def update_cache(self, target_code: TargetCode) -> None:
-        cache_name = self._construct_cache_name(target_code.entity_name, target_code)
-        await self._set_cache(str(target_code.entity.id), target_code.entity, cache_name)
+        entity_name = target_code.entity_name
+        cache_name = self._construct_cache_name(entity_name, target_code)
+        tags = self._construct_cache_tags(entity_name, target_code)
         menu, submenu, dish = ENTITY_NAME_TO_ENTITY_TYPE.keys()
         if target_code.entity_name == menu:
             entities, cache_name = await self._construct_param_for_update_cache(target_code)
@@ -137,7 +263,31 @@ class RestaurantService:
         else:
             entities, cache_name = await self._construct_param_for_update_cache(target_code,
                                                                                 submenu_id=target_code.submenu_id)
-        return await self._set_cache(target_code.entity_name, entities, cache_name)
+        entries = (
+            self._construct_cache_entry(
+                str(target_code.entity.id), target_code.entity, cache_name, ENTITY_NAME_TO_SERIALIZER[entity_name], tags
+            ),
+            self._construct_cache_entry(
+                entity_name, entities, cache_name, ENTITY_NAME_TO_LIST_SERIALIZER[entity_name], tags
+            ),
+        )
+        await self._write_cache(entries)
+
+    async def bulk_update_cache(self, target_code: TargetCode) -> None:
+        # The whole hash of the parent is dropped once, whatever the number of upserted rows.
+        cache_name = self._construct_cache_name(target_code.entity_name, target_code)
+        deleted = [(cache_name, ()), (cache_name + PAGE_CACHE_SUFFIX, ())]
+        await self._write_cache(await self.get_cache_entities(target_code), deleted)
+
+    async def _write_cache(self,
+                           entries: list[CacheEntry],
+                           deleted: list[tuple[str, tuple[str, ...]]] = ()) -> None:
+        # Every rewritten list makes the tree and the pages cut from that list stale.
+        deleted = [self._construct_param_for_delete_cache_tree(), *deleted]
+        deleted.extend(
+            (entry.name + PAGE_CACHE_SUFFIX, ()) for entry in entries if entry.key in ENTITY_NAME_TO_ENTITY_TYPE
+        )
+        await self.cache.hset_many(entries, deleted)
 
     async def _construct_param_for_update_cache(self,
                                                 target_code: TargetCode,
@@ -146,66 +296,96 @@ class RestaurantService:
         cache_name = self._construct_cache_name(target_code.entity_name, target_code)
         return entities, cache_name
 
-    async def set_cache_entities(self, target_code: TargetCode) -> None:
+    async def get_cache_entities(self, target_code: TargetCode) -> list[CacheEntry]:
         menu, submenu, dish = ENTITY_NAME_TO_ENTITY_TYPE.keys()
         if target_code.entity_name == menu:
-            return
+            return []
 
+        entries = []
         if target_code.entity_name == dish:
-            await self._set_cache_entities(
+            entries.extend(await self._get_cache_entities(
                 submenu,
                 ENTITY_NAME_TO_ENTITY_TYPE[submenu],
                 target_code.submenu_id,
                 target_code,
                 menu_id=target_code.menu_id
-            )
+            ))
 
-        await self._set_cache_entities(
+        entries.extend(await self._get_cache_entities(
             menu,
             ENTITY_NAME_TO_ENTITY_TYPE[menu],
             target_code.menu_id,
             target_code
-        )
+        ))
+        return entries
 
-    async def _set_cache_entities(self,
+    async def _get_cache_entities(self,
                                   entity_name: str,
                                   entity_type: type[Base],
                                   entity_id: str,
                                   target_code: TargetCode,
-                                  **kwargs) -> None:
+                                  **kwargs) -> list[CacheEntry]:
         entity = await self.repository.get_entity_by_id(entity_type, entity_id)
         entities = await self.repository.get_entities(entity_type, **kwargs)
         cache_name = self._construct_cache_name(entity_name, target_code)
-        await self._set_cache(entity_id, entity, cache_name)
-        await self._set_cache(entity_name, entities, cache_name)
+        tags = self._construct_cache_tags(entity_name, target_code)
+        entries = [
+            self._construct_cache_entry(entity_name, entities, cache_name, ENTITY_NAME_TO_LIST_SERIALIZER[entity_name], tags)
+        ]
+        if entity is not None:
+            entries.append(
+                self._construct_cache_entry(entity_id, entity, cache_name, ENTITY_NAME_TO_SERIALIZER[entity_name], tags)
+            )
+        return entries
 
     @staticmethod
-    def _serialize_pickle(entity: Base) -> bytes:
-        return pickle.dumps(entity, protocol=pickle.HIGHEST_PROTOCOL)
+    def _construct_cache_entry(key: str,
+                               value: Base | list[Base],
+                               cache_name: str,
+                               serializer: CacheSerializer,
+                               tags: tuple[str, ...] = ()) -> CacheEntry:
+        return CacheEntry(cache_name, key, serializer.dumps(value), tags)
 
     @staticmethod
-    def _deserialize_pickle(value: bytes) -> Base | list[Base] | None:
-        try:
-            return pickle.loads(value)
-        except TypeError:
-            return None
+    def _construct_param_for_delete_cache_tree() -> tuple[str, tuple[str, ...]]:
+        menu, submenu, dish = ENTITY_NAME_TO_ENTITY_TYPE.keys()
+        return f'{menu}::{submenu}::{dish}:', (TREE_CACHE_KEY,)
 
-    @staticmethod
-    def _construct_param_for_delete_cache(target_code: TargetCode) -> tuple[str, tuple[str, ...], str]:
+    @classmethod
+    def _construct_param_for_delete_cache(
+            cls,
+            target_code: TargetCode
+    ) -> tuple[str, tuple[str, ...], tuple[str, ...], tuple[str, ...]]:
         menu, submenu, dish = ENTITY_NAME_TO_ENTITY_TYPE.keys()
         if target_code.entity_name == menu:
             cache_name = f'{menu}::{submenu}::{dish}:'
             keys = (menu, target_code.menu_id)
-            pattern = f'{menu}:{target_code.menu_id}:{submenu}:*'
+            names = ()
+            tags = (cls._construct_menu_tag(target_code.menu_id),)
         elif target_code.entity_name == submenu:
             cache_name = f'{menu}:{target_code.menu_id}:{submenu}::{dish}:'
             keys = (submenu, target_code.submenu_id)
-            pattern = f'{menu}:{target_code.menu_id}:{submenu}:{target_code.submenu_id}:{dish}:'
+            dish_cache_name = f'{menu}:{target_code.menu_id}:{submenu}:{target_code.submenu_id}:{dish}:'
+            names = (dish_cache_name, dish_cache_name + PAGE_CACHE_SUFFIX)
+            tags = ()
         else:
             cache_name = f'{menu}:{target_code.menu_id}:{submenu}:{target_code.submenu_id}:{dish}:'
             keys = (dish, target_code.dish_id)
-            pattern = ''
-        return cache_name, keys, pattern
+            names = ()
+            tags = ()
+        return cache_name, keys, names, tags
+
+    @classmethod
+    def _construct_cache_tags(cls, entity_name: str, target_code: TargetCode) -> tuple[str, ...]:
+        # Every hash below a menu is registered under the menu tag, so deleting the menu drops its whole subtree.
+        menu, *_ = ENTITY_NAME_TO_ENTITY_TYPE.keys()
+        if entity_name == menu:
+            return ()
+        return (cls._construct_menu_tag(target_code.menu_id),)
+
+    @staticmethod
+    def _construct_menu_tag(menu_id: str) -> str:
+        return f'Tag:{Menu.__name__}:{menu_id}'
 
     @staticmethod
     def _get_relation_column_name_to_value(target_code: TargetCode, entity_type: type[Base]) -> dict[str, str]:
@@ -218,6 +398,11 @@ class RestaurantService:
     def _construct_entity_param(target_code: TargetCode) -> tuple[type[Base], str, str]:
         return ENTITY_NAME_TO_ENTITY_TYPE[target_code.entity_name], target_code.entity_name, target_code.get_entity_id
 
+    @staticmethod
+    def _count_cache_request(cache_name: str, key: str, cache_value: bytes | None) -> None:
+        cache, kind = construct_cache_labels(cache_name, key)
+        CACHE_REQUESTS.labels(cache=cache, kind=kind, result='miss' if cache_value is None else 'hit').inc()
+
     @staticmethod
     def _construct_cache_name(entity_name: str, target_code: TargetCode) -> str:
         menu, submenu, dish = ENTITY_NAME_TO_ENTITY_TYPE.keys()
@@ -0,0 +1,27 @@
+from database.models import Dish, Menu, Submenu
+from database.redis_cache import RedisCache
+from database.session_manager import sessionmaker
+from repository.restaurant_repository import RestaurantRepository, SyncResult
+from service.restaurant_service import RestaurantService
+from task.parser_service import RestaurantMenu
+
+
+class DbAdminRestaurant:
+    async def load_restaurant_menu_in_db(self, restaurant_menu: RestaurantMenu) -> SyncResult:
+        async with sessionmaker() as session:
+            service = RestaurantService(RestaurantRepository(session), RedisCache())
+            return await service.sync_catalog(self.construct_table_to_rows(restaurant_menu))
+
+    @staticmethod
+    def construct_table_to_rows(restaurant_menu: RestaurantMenu) -> dict[str, list[dict]]:
+        return {
+            Menu.__tablename__: [menu.model_dump() for menu in restaurant_menu.menu_id_to_menu.values()],
+            Submenu.__tablename__: [
+                {**submenu.model_dump(), 'menu_id': menu_id}
+                for (menu_id, _), submenu in restaurant_menu.menu_id_submenu_id_to_submenu.items()
+            ],
+            Dish.__tablename__: [
+                {**dish.model_dump(), 'submenu_id': submenu_id}
+                for (_, submenu_id, _), dish in restaurant_menu.menu_id_submenu_id_dish_id_to_dish.items()
+            ],
+        }
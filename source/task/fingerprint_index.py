@@ -0,0 +1,60 @@
+import hashlib
+from dataclasses import dataclass, field
+
+from redis import asyncio as aioredis
+
+from core.config import settings
+from database.redis_cache import RedisCache
+from task.parser_service import RestaurantMenu
+
+
+@dataclass
+class ChangeSet:
+    added: list[tuple[str, ...]] = field(default_factory=list)
+    changed: list[tuple[str, ...]] = field(default_factory=list)
+    removed: list[tuple[str, ...]] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+class FingerprintIndex:
+    def __init__(self, redis_connection: aioredis.Redis | None = None, key: str = settings.sync.fingerprint_key):
+        self.redis_connection = redis_connection or RedisCache.redis_connection
+        self.key = key
+
+    async def load(self) -> dict[str, str]:
+        return {
+            entity_key.decode(): fingerprint.decode()
+            for entity_key, fingerprint in (await self.redis_connection.hgetall(self.key)).items()
+        }
+
+    async def save(self, fingerprints: dict[str, str]) -> None:
+        async with self.redis_connection.pipeline(transaction=True) as pipeline:
+            pipeline.delete(self.key)
+            if fingerprints:
+                pipeline.hset(self.key, mapping=fingerprints)
+            await pipeline.execute()
+
+    async def clear(self) -> None:
+        await self.redis_connection.delete(self.key)
+
+    @staticmethod
+    def construct_fingerprints(restaurant_menu: RestaurantMenu) -> dict[str, str]:
+        return {
+            ':'.join(key): hashlib.sha1(entity.model_dump_json().encode()).hexdigest()
+            for key, entity in restaurant_menu.get_key_to_entity().items()
+        }
+
+    @staticmethod
+    def diff(previous: dict[str, str], current: dict[str, str]) -> ChangeSet:
+        # A row moved under another parent gets a new key, so it is removed and added again with the same id.
+        change_set = ChangeSet()
+        for entity_key, fingerprint in current.items():
+            if entity_key not in previous:
+                change_set.added.append(tuple(entity_key.split(':')))
+            elif previous[entity_key] != fingerprint:
+                change_set.changed.append(tuple(entity_key.split(':')))
+        change_set.removed.extend(tuple(entity_key.split(':')) for entity_key in previous.keys() - current.keys())
+        return change_set
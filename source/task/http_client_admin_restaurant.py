@@ -1,33 +1,74 @@
+import asyncio
 import json
 from collections import defaultdict
 from contextlib import asynccontextmanager
 from decimal import Decimal
 from typing import Any, TypeVar
 
-from httpx import AsyncClient
+from httpx import AsyncBaseTransport, AsyncClient, Limits, Response
 
 from core.config import settings
 from database.schemas import MenuCreation, SubmenuCreation, DishCreation
 from task.abstract_http_client import AbstractHttpClient
-from task.parser_xlsx_service import RestaurantMenu
+from task.fingerprint_index import ChangeSet, FingerprintIndex
+from task.parser_service import RestaurantMenu
 
 
 EntityFromExcel = TypeVar("EntityFromExcel", MenuCreation, SubmenuCreation, DishCreation)
 
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+URL_PARAMS = ('target_menu_id', 'target_submenu_id', 'target_dish_id')
+
 
 class HttpClientAdminRestaurant(AbstractHttpClient):
-    def __init__(self):
+    def __init__(self, transport: AsyncBaseTransport | None = None):
         self.base_url: str = f'http://{settings.url.host}:{settings.url.port}'
+        self.transport = transport
+        self._client: AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
 
     @property
     @asynccontextmanager
     async def client(self):
-        client = AsyncClient(base_url=self.base_url)
+        if self._client is not None:
+            async with self._semaphore:
+                yield self._client
+            return
+
+        client = AsyncClient(base_url=self.base_url, headers=JSON_HEADERS, transport=self.transport)
         try:
             yield client
         finally:
             await client.aclose()
 
+    @asynccontextmanager
+    async def session(self):
+        # A client opened by the worker runtime is kept, otherwise the pool lives for this sync run only.
+        if self._client is not None:
+            yield self._client
+            return
+
+        await self.open()
+        try:
+            yield self._client
+        finally:
+            await self.aclose()
+
+    async def open(self) -> None:
+        # One keep-alive pool serves every request, the semaphore bounds requests in flight.
+        concurrency = settings.sync.concurrency
+        limits = Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self._client = AsyncClient(
+            base_url=self.base_url, headers=JSON_HEADERS, transport=self.transport, limits=limits
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client, self._semaphore = None, None
+
     async def get(self, url: str) -> Any:
         async with self.client as client:
             response = await client.get(url)
@@ -35,67 +76,174 @@ class HttpClientAdminRestaurant(AbstractHttpClient):
                 return None
         return response.json()
 
-    async def post(self, url: str, json_data: str) -> None:
+    async def post(self, url: str, json_data: str) -> Response:
         async with self.client as client:
-            await client.post(url, data=json_data)
+            return await client.post(url, content=json_data)
 
-    async def patch(self, url: str, json_data: str) -> None:
+    async def patch(self, url: str, json_data: str) -> Response:
         async with self.client as client:
-            await client.patch(url, data=json_data)
+            return await client.patch(url, content=json_data)
 
-    async def delete(self, url: str) -> None:
+    async def delete(self, url: str) -> Response:
         async with self.client as client:
-            await client.delete(url)
+            return await client.delete(url)
+
+    async def push_restaurant_menu_tree(self, restaurant_menu: RestaurantMenu) -> dict:
+        async with self.session(), self.client as client:
+            response = await client.put(
+                settings.url.target_menus + settings.url.target_sync,
+                content=json.dumps(self.construct_tree(restaurant_menu)),
+            )
+        self._check_responses([response])
+        return response.json()
+
+    async def load_restaurant_menu_changes(self,
+                                           restaurant_menu: RestaurantMenu,
+                                           fingerprint_index: FingerprintIndex,
+                                           owns_all_menus: bool = True) -> None:
+        fingerprints = fingerprint_index.construct_fingerprints(restaurant_menu)
+        previous_fingerprints = await fingerprint_index.load()
+        try:
+            if not previous_fingerprints and owns_all_menus:
+                await self.load_restaurant_menu_in_db(restaurant_menu)
+            elif not previous_fingerprints:
+                await self.load_own_menus(restaurant_menu)
+            else:
+                await self.apply_changes(restaurant_menu, fingerprint_index.diff(previous_fingerprints, fingerprints))
+        except Exception:
+            # Part of the changes may be applied already, the next run falls back to a full sync.
+            await fingerprint_index.clear()
+            raise
+        await fingerprint_index.save(fingerprints)
+
+    async def apply_changes(self, restaurant_menu: RestaurantMenu, change_set: ChangeSet) -> None:
+        if change_set.is_empty:
+            return
+
+        async with self.session():
+            removed = set(change_set.removed)
+            # Children of a removed parent are dropped by the cascade and need no request of their own.
+            responses = await asyncio.gather(*(
+                self.delete(self._construct_urls(key)[1]) for key in removed
+                if not any(key[:depth] in removed for depth in range(1, len(key)))
+            ))
+            self._check_responses(responses)
+
+            key_to_entity = restaurant_menu.get_key_to_entity()
+            for depth in range(1, len(URL_PARAMS) + 1):
+                responses = await asyncio.gather(
+                    *(
+                        self.post(self._construct_urls(key)[0], key_to_entity[key].model_dump_json())
+                        for key in change_set.added if len(key) == depth
+                    ),
+                    *(
+                        self.patch(self._construct_urls(key)[1], key_to_entity[key].model_dump_json())
+                        for key in change_set.changed if len(key) == depth
+                    ),
+                )
+                self._check_responses(responses)
 
     async def load_restaurant_menu_in_db(self, restaurant_menu: RestaurantMenu) -> None:
-        menu_ids_from_db = set(await self.get_entity_ids(settings.url.target_menus))
-        if not menu_ids_from_db:
-            return await self.post_entity(restaurant_menu)
+        async with self.session():
+            menu_ids_from_db = set(await self.get_entity_ids(settings.url.target_menus))
+            if not menu_ids_from_db:
+                return await self.post_entity(restaurant_menu)
+
+            menu_ids_from_excel = set(restaurant_menu.menu_id_to_menu)
+            diffs = menu_ids_from_db - menu_ids_from_excel
+            responses = await asyncio.gather(*(
+                self.delete(settings.url.target_menus + settings.url.target_menu_id.format(target_menu_id=diff))
+                for diff in diffs
+            ))
+            self._check_responses(responses)
+
+            await self._delete_diff(restaurant_menu)
+            await self.update_entity(restaurant_menu)
 
-        menu_ids_from_excel = set(restaurant_menu.menu_id_to_menu)
-        diffs = menu_ids_from_db - menu_ids_from_excel
-        if diffs:
-            for diff in diffs:
-                await self.delete(settings.url.target_menus + settings.url.target_menu_id.format(target_menu_id=diff))
+    async def load_own_menus(self, restaurant_menu: RestaurantMenu) -> None:
+        # Menus of other files stay untouched, only the menus of this one are reconciled with their subtrees.
+        async with self.session():
+            await self.update_menus(restaurant_menu)
+            await self.load_subtree(restaurant_menu)
 
-        await self._delete_diff(restaurant_menu)
-        await self.update_entity(restaurant_menu)
+    async def load_menus(self, restaurant_menu: RestaurantMenu) -> list[str]:
+        # The top level of a fanned out sync: menus only, their subtrees are reconciled by load_subtree.
+        async with self.session():
+            menu_ids_from_db = set(await self.get_entity_ids(settings.url.target_menus))
+            deleted_menu_ids = list(menu_ids_from_db - set(restaurant_menu.menu_id_to_menu))
+            responses = await asyncio.gather(*(
+                self.delete(settings.url.target_menus + settings.url.target_menu_id.format(target_menu_id=menu_id))
+                for menu_id in deleted_menu_ids
+            ))
+            self._check_responses(responses)
+            await self.update_menus(restaurant_menu)
+        return deleted_menu_ids
+
+    async def load_subtree(self, restaurant_menu: RestaurantMenu) -> None:
+        async with self.session():
+            await self._delete_diff(restaurant_menu)
+            await self.update_children(restaurant_menu)
 
     async def post_entity(self, restaurant_menu: RestaurantMenu) -> None:
-        for menu in restaurant_menu.menu_id_to_menu.values():
-            await self.post(settings.url.target_menus, menu.model_dump_json())
+        # Each level is sent concurrently, but only after the whole level of parents exists.
+        responses = await asyncio.gather(*(
+            self.post(settings.url.target_menus, menu.model_dump_json())
+            for menu in restaurant_menu.menu_id_to_menu.values()
+        ))
+        self._check_responses(responses)
 
-        for (menu_id, _), submenu in restaurant_menu.menu_id_submenu_id_to_submenu.items():
-            await self.post(settings.url.target_submenus.format(target_menu_id=menu_id), submenu.model_dump_json())
+        responses = await asyncio.gather(*(
+            self.post(settings.url.target_submenus.format(target_menu_id=menu_id), submenu.model_dump_json())
+            for (menu_id, _), submenu in restaurant_menu.menu_id_submenu_id_to_submenu.items()
+        ))
+        self._check_responses(responses)
 
-        for (menu_id, submenu_id, _), dish in restaurant_menu.menu_id_submenu_id_dish_id_to_dish.items():
-            await self.post(
+        responses = await asyncio.gather(*(
+            self.post(
                 settings.url.target_dishes.format(target_menu_id=menu_id, target_submenu_id=submenu_id),
                 dish.model_dump_json(),
             )
+            for (menu_id, submenu_id, _), dish in restaurant_menu.menu_id_submenu_id_dish_id_to_dish.items()
+        ))
+        self._check_responses(responses)
 
     async def update_entity(self, restaurant_menu: RestaurantMenu) -> None:
+        await self.update_menus(restaurant_menu)
+        await self.update_children(restaurant_menu)
+
+    async def update_menus(self, restaurant_menu: RestaurantMenu) -> None:
         target_menus, target_menu_id = settings.url.target_menus, settings.url.target_menu_id
+        responses = await asyncio.gather(*(
+            self.update_or_post_entity(target_menus, target_menus + target_menu_id.format(target_menu_id=menu_id), menu)
+            for menu_id, menu in restaurant_menu.menu_id_to_menu.items()
+        ))
+        self._check_responses(responses)
+
+    async def update_children(self, restaurant_menu: RestaurantMenu) -> None:
         target_submenus, target_submenu_id = settings.url.target_submenus, settings.url.target_submenu_id
         target_dishes, target_dish_id = settings.url.target_dishes, settings.url.target_dish_id
-        for menu_id, menu in restaurant_menu.menu_id_to_menu.items():
-            menu_id_url = target_menus + target_menu_id.format(target_menu_id=menu_id)
-            await self.update_or_post_entity(target_menus, menu_id_url, menu)
-
+        submenus = []
         for (menu_id, submenu_id), submenu in restaurant_menu.menu_id_submenu_id_to_submenu.items():
             submenus_url = target_submenus.format(target_menu_id=menu_id)
             submenu_id_url = submenus_url + target_submenu_id.format(target_submenu_id=submenu_id)
-            await self.update_or_post_entity(submenus_url, submenu_id_url, submenu)
+            submenus.append(self.update_or_post_entity(submenus_url, submenu_id_url, submenu))
+        self._check_responses(await asyncio.gather(*submenus))
 
+        dishes = []
         for (menu_id, submenu_id, dish_id), dish in restaurant_menu.menu_id_submenu_id_dish_id_to_dish.items():
             dishes_url = target_dishes.format(target_menu_id=menu_id, target_submenu_id=submenu_id)
             dish_id_url = dishes_url + target_dish_id.format(target_dish_id=dish_id)
-            await self.update_or_post_entity(dishes_url, dish_id_url, dish)
+            dishes.append(self.update_or_post_entity(dishes_url, dish_id_url, dish))
+        self._check_responses(await asyncio.gather(*dishes))
 
     async def get_entity_ids(self, url: str) -> list[str]:
         return [entity['id'] for entity in await self.get(url)]
 
-    async def update_or_post_entity(self, post_url: str, target_url: str, entity_from_excel: EntityFromExcel) -> None:
+    async def update_or_post_entity(self,
+                                    post_url: str,
+                                    target_url: str,
+                                    entity_from_excel: EntityFromExcel) -> Response | None:
+        # None when the entity is up to date already and no request was sent.
         model_dump_json = entity_from_excel.model_dump_json()
         column_to_value = json.loads(model_dump_json)
         answer = await self.get(target_url)
@@ -110,46 +258,99 @@ class HttpClientAdminRestaurant(AbstractHttpClient):
 
         for column in columns:
             if column_to_value[column] != answer[column] and column_to_value[column] is not None:
-                await self.patch(target_url, model_dump_json)
-                break
+                return await self.patch(target_url, model_dump_json)
+
+    @staticmethod
+    def construct_tree(restaurant_menu: RestaurantMenu) -> list[dict]:
+        menu_id_to_tree = {
+            menu_id: {**menu.model_dump(mode='json'), 'submenus': []}
+            for menu_id, menu in restaurant_menu.menu_id_to_menu.items()
+        }
+        menu_id_submenu_id_to_tree = {}
+        for (menu_id, submenu_id), submenu in restaurant_menu.menu_id_submenu_id_to_submenu.items():
+            submenu_tree = {**submenu.model_dump(mode='json'), 'dishes': []}
+            menu_id_to_tree[menu_id]['submenus'].append(submenu_tree)
+            menu_id_submenu_id_to_tree[(menu_id, submenu_id)] = submenu_tree
+        for (menu_id, submenu_id, _), dish in restaurant_menu.menu_id_submenu_id_dish_id_to_dish.items():
+            menu_id_submenu_id_to_tree[(menu_id, submenu_id)]['dishes'].append(dish.model_dump(mode='json'))
+        return list(menu_id_to_tree.values())
+
+    @staticmethod
+    def construct_restaurant_menu(menu_trees: list[dict]) -> RestaurantMenu:
+        restaurant_menu = RestaurantMenu()
+        for menu_tree in menu_trees:
+            menu = MenuCreation.model_validate(menu_tree)
+            menu_id = str(menu.id)
+            restaurant_menu.menu_id_to_menu[menu_id] = menu
+            for submenu_tree in menu_tree['submenus']:
+                submenu = SubmenuCreation.model_validate(submenu_tree)
+                submenu_id = str(submenu.id)
+                restaurant_menu.menu_id_submenu_id_to_submenu[(menu_id, submenu_id)] = submenu
+                for dish_tree in submenu_tree['dishes']:
+                    dish = DishCreation.model_validate(dish_tree)
+                    restaurant_menu.menu_id_submenu_id_dish_id_to_dish[(menu_id, submenu_id, str(dish.id))] = dish
+        return restaurant_menu
+
+    @staticmethod
+    def _construct_urls(key: tuple[str, ...]) -> tuple[str, str]:
+        collection_url, entity_id_url = (
+            (settings.url.target_menus, settings.url.target_menu_id),
+            (settings.url.target_submenus, settings.url.target_submenu_id),
+            (settings.url.target_dishes, settings.url.target_dish_id),
+        )[len(key) - 1]
+        url_params = dict(zip(URL_PARAMS, key))
+        collection_url = collection_url.format(**url_params)
+        return collection_url, collection_url + entity_id_url.format(**url_params)
+
+    @staticmethod
+    def _check_responses(responses: list[Response | None]) -> None:
+        for response in responses:
+            if response is not None and response.is_error:
+                raise RuntimeError(
+                    f'{response.request.method} {response.request.url} failed with {response.status_code}'
+                )
 
     async def _delete_diff(self, restaurant_menu: RestaurantMenu) -> None:
         menu_id_to_submenu_ids_db, menu_id_to_submenu_ids_excel = defaultdict(set), defaultdict(set)
         menu_id_submenu_id_to_dish_ids_db, menu_id_submenu_id_to_dish_ids_excel = defaultdict(set), defaultdict(set)
 
-        for menu_id in restaurant_menu.menu_id_to_menu.keys():
-            menu_id_to_submenu_ids_db[menu_id].update(
-                await self.get_entity_ids(settings.url.target_submenus.format(target_menu_id=menu_id))
-            )
+        menu_ids = list(restaurant_menu.menu_id_to_menu)
+        submenu_ids_db = await asyncio.gather(*(
+            self.get_entity_ids(settings.url.target_submenus.format(target_menu_id=menu_id)) for menu_id in menu_ids
+        ))
+        for menu_id, submenu_ids in zip(menu_ids, submenu_ids_db):
+            menu_id_to_submenu_ids_db[menu_id].update(submenu_ids)
 
-        for menu_id, submenu_id in restaurant_menu.menu_id_submenu_id_to_submenu.keys():
-            menu_id_submenu_id_to_dish_ids_db[(menu_id, submenu_id)].update(
-                await self.get_entity_ids(
-                    settings.url.target_dishes.format(target_menu_id=menu_id, target_submenu_id=submenu_id)
-                )
-            )
+        menu_id_submenu_ids = list(restaurant_menu.menu_id_submenu_id_to_submenu)
+        dish_ids_db = await asyncio.gather(*(
+            self.get_entity_ids(settings.url.target_dishes.format(target_menu_id=menu_id, target_submenu_id=submenu_id))
+            for menu_id, submenu_id in menu_id_submenu_ids
+        ))
+        for menu_id_submenu_id, dish_ids in zip(menu_id_submenu_ids, dish_ids_db):
+            menu_id_submenu_id_to_dish_ids_db[menu_id_submenu_id].update(dish_ids)
 
         for menu_id, submenu_id, dish_id in restaurant_menu.menu_id_submenu_id_dish_id_to_dish.keys():
             menu_id_to_submenu_ids_excel[menu_id].add(submenu_id)
             menu_id_submenu_id_to_dish_ids_excel[(menu_id, submenu_id)].add(dish_id)
 
+        urls = []
         for menu_id in menu_id_to_submenu_ids_excel:
             submenu_difference_ids = menu_id_to_submenu_ids_db[menu_id] - menu_id_to_submenu_ids_excel[menu_id]
-            if submenu_difference_ids:
-                for submenu_id in submenu_difference_ids:
-                    url = settings.url.target_submenus + settings.url.target_submenu_id
-                    await self.delete(url.format(target_menu_id=menu_id, target_submenu_id=submenu_id))
+            for submenu_id in submenu_difference_ids:
+                url = settings.url.target_submenus + settings.url.target_submenu_id
+                urls.append(url.format(target_menu_id=menu_id, target_submenu_id=submenu_id))
 
         for menu_id_submenu_id in menu_id_submenu_id_to_dish_ids_excel:
             dish_difference_ids = (
                     menu_id_submenu_id_to_dish_ids_db[menu_id_submenu_id]
                     - menu_id_submenu_id_to_dish_ids_excel[menu_id_submenu_id]
             )
-            if dish_difference_ids:
-                for dish_id in dish_difference_ids:
-                    url = settings.url.target_dishes + settings.url.target_dish_id
-                    await self.delete(url.format(
-                        target_menu_id=menu_id_submenu_id[0],
-                        target_submenu_id=menu_id_submenu_id[1],
-                        target_dish_id=dish_id,
-                    ))
+            for dish_id in dish_difference_ids:
+                url = settings.url.target_dishes + settings.url.target_dish_id
+                urls.append(url.format(
+                    target_menu_id=menu_id_submenu_id[0],
+                    target_submenu_id=menu_id_submenu_id[1],
+                    target_dish_id=dish_id,
+                ))
+        # Dishes are only read back for submenus kept in the sheet, so both kinds of deletion can run together.
+        self._check_responses(await asyncio.gather(*(self.delete(url) for url in urls)))
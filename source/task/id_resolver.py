@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable
+
+
+# Fixed namespace, so the same title path maps to the same id on every machine and every run.
+UUID5_NAMESPACE = uuid.UUID('5d0e6a2c-8f43-4b7e-9a61-3c2f0b9d7e14')
+
+
+class IdResolver(ABC):
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @abstractmethod
+    def resolve(self, row: int, column: int, title_path: tuple[str, ...]) -> str:
+        pass
+
+    def merge(self, other: 'IdResolver') -> None:
+        # Takes over the ids generated by a resolver that ran in a parse pool process.
+        pass
+
+    async def flush(self) -> bool:
+        # Returns whether the workbook itself was rewritten and has to be hashed again.
+        return False
+
+
+# Writes generated ids into the source file in place, every file format brings its own.
+IdWriter = Callable[[str, dict[tuple[int, int], str]], None]
+
+
+class WriteBackIdResolver(IdResolver):
+    def __init__(self, path: str, write_ids: IdWriter) -> None:
+        super().__init__(path)
+        self.write_ids = write_ids
+        self.row_column_to_id: dict[tuple[int, int], str] = {}
+
+    def resolve(self, row: int, column: int, title_path: tuple[str, ...]) -> str:
+        entity_id = str(uuid.uuid4())
+        self.row_column_to_id[(row, column)] = entity_id
+        return entity_id
+
+    def merge(self, other: 'WriteBackIdResolver') -> None:
+        self.row_column_to_id.update(other.row_column_to_id)
+
+    async def flush(self) -> bool:
+        if not self.row_column_to_id:
+            return False
+        self.write_ids(self.path, self.row_column_to_id)
+        self.row_column_to_id.clear()
+        return True
+
+
+class SidecarIdResolver(IdResolver):
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.map_path = Path(path).with_suffix('.ids.json')
+        self.fingerprint_to_id: dict[str, str] = (
+            json.loads(self.map_path.read_text()) if self.map_path.exists() else {}
+        )
+        self.changed = False
+
+    def resolve(self, row: int, column: int, title_path: tuple[str, ...]) -> str:
+        fingerprint = self.construct_fingerprint(title_path)
+        if fingerprint not in self.fingerprint_to_id:
+            self.fingerprint_to_id[fingerprint] = str(uuid.uuid4())
+            self.changed = True
+        return self.fingerprint_to_id[fingerprint]
+
+    def merge(self, other: 'SidecarIdResolver') -> None:
+        if other.changed:
+            self.fingerprint_to_id.update(other.fingerprint_to_id)
+            self.changed = True
+
+    async def flush(self) -> bool:
+        if self.changed:
+            temporary_path = self.map_path.with_suffix('.tmp')
+            temporary_path.write_text(json.dumps(self.fingerprint_to_id, indent=2, sort_keys=True))
+            os.replace(temporary_path, self.map_path)
+            self.changed = False
+        return False
+
+    @staticmethod
+    def construct_fingerprint(title_path: tuple[str, ...]) -> str:
+        # Titles are unique, so the path survives rows being moved or reordered in the sheet.
+        return hashlib.sha1(json.dumps(title_path, ensure_ascii=False).encode()).hexdigest()
+
+
+class Uuid5IdResolver(IdResolver):
+    def resolve(self, row: int, column: int, title_path: tuple[str, ...]) -> str:
+        # Renaming an entity changes its id, so the sync treats it as deleted and created again.
+        return str(uuid.uuid5(UUID5_NAMESPACE, json.dumps(title_path, ensure_ascii=False)))
+
+
+ID_MODE_TO_RESOLVER = {
+    'write_back': WriteBackIdResolver,
+    'sidecar': SidecarIdResolver,
+    'uuid5': Uuid5IdResolver,
+}
+
+
+def construct_id_resolver(id_mode: str, path: str, write_ids: IdWriter) -> IdResolver:
+    if id_mode not in ID_MODE_TO_RESOLVER:
+        raise ValueError(f'unknown id mode {id_mode}, expected one of {", ".join(ID_MODE_TO_RESOLVER)}')
+    if id_mode == 'write_back':
+        return WriteBackIdResolver(path, write_ids)
+    return ID_MODE_TO_RESOLVER[id_mode](path)
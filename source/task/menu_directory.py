@@ -0,0 +1,85 @@
+import asyncio
+from dataclasses import dataclass
+from pathlib import Path
+
+from redis import asyncio as aioredis
+
+from core.config import settings
+from database.redis_cache import RedisCache
+from task.fingerprint_index import FingerprintIndex
+from task.parser_factory import EXTENSION_TO_PARSER, construct_parser
+from task.parser_service import ParserService, RestaurantMenu, parse_file
+from task.parser_xlsx_service import get_parse_pool
+from task.sync_state import FileStateStore
+
+
+@dataclass
+class MenuFile:
+    path: str
+    parser: ParserService
+    fingerprint_index: FingerprintIndex
+
+
+class MenuDirectory:
+    # Every file of the directory keeps its own hash, stat and fingerprints, so it owns the menus it lists
+    # and a change to one file never makes the others parsed or diffed again.
+    def __init__(self,
+                 path: str,
+                 redis_connection: aioredis.Redis | None = None,
+                 files_key: str = settings.sync.files_key) -> None:
+        self.path = Path(path)
+        self.redis_connection = redis_connection or RedisCache.redis_connection
+        self.files_key = files_key
+        self.file_path_to_menu_file: dict[str, MenuFile] = {}
+
+    def list_files(self) -> list[str]:
+        # Temporary and lock files of editors start with a dot or ~$ and are left out.
+        return sorted(
+            str(file_path) for file_path in self.path.iterdir()
+            if file_path.is_file()
+            and file_path.suffix.lower() in EXTENSION_TO_PARSER
+            and not file_path.name.startswith(('.', '~$'))
+        )
+
+    def get_menu_file(self, file_path: str) -> MenuFile:
+        if file_path not in self.file_path_to_menu_file:
+            self.file_path_to_menu_file[file_path] = MenuFile(
+                file_path, construct_parser(file_path), self.construct_fingerprint_index(file_path)
+            )
+        return self.file_path_to_menu_file[file_path]
+
+    async def find_changed_files(self, file_state: FileStateStore) -> list[MenuFile]:
+        changed_files = []
+        for file_path in self.list_files():
+            menu_file = self.get_menu_file(file_path)
+            if menu_file.parser.hash_file is None:
+                await file_state.restore(menu_file.parser, file_path)
+            if await menu_file.parser.check_hash_file(file_path):
+                changed_files.append(menu_file)
+        return changed_files
+
+    async def find_removed_files(self) -> list[str]:
+        synced_file_paths = {file_path.decode() for file_path in await self.redis_connection.smembers(self.files_key)}
+        return sorted(synced_file_paths - set(self.list_files()))
+
+    async def parse(self, menu_file: MenuFile) -> RestaurantMenu:
+        # The parse is CPU bound and runs off the event loop, so the files are parsed while the others sync:
+        # one file per process of the parse pool with workers, in the default thread pool without.
+        # The ids generated there are written by the parser of the file afterwards.
+        executor = get_parse_pool(settings.parser.workers) if settings.parser.workers else None
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            executor, parse_file, type(menu_file.parser), menu_file.path, menu_file.parser.id_mode
+        )
+        return await menu_file.parser.merge_parsed(menu_file.path, [result])
+
+    async def add_file(self, file_path: str) -> None:
+        await self.redis_connection.sadd(self.files_key, file_path)
+
+    async def remove_file(self, file_path: str) -> None:
+        self.file_path_to_menu_file.pop(file_path, None)
+        await self.redis_connection.srem(self.files_key, file_path)
+
+    @staticmethod
+    def construct_fingerprint_index(file_path: str) -> FingerprintIndex:
+        return FingerprintIndex(key=f'{settings.sync.fingerprint_key}:{file_path}')
@@ -0,0 +1,31 @@
+import csv
+import os
+from itertools import islice
+from typing import Iterator
+
+from core.config import settings
+from task.parser_service import ParserService
+
+
+class ParserCsvService(ParserService):
+    # The columns of a record are the columns of the sheet, an export of the workbook parses as it is.
+    def read_rows(self, min_row: int = 1, max_row: int | None = None) -> Iterator[tuple[int, tuple]]:
+        # utf-8-sig drops the byte order mark that spreadsheet exports put in front of the first record.
+        with open(self.path, newline='', encoding='utf-8-sig') as file:
+            records = enumerate(csv.reader(file, delimiter=settings.parser.csv_delimiter), start=1)
+            for row, values in islice(records, min_row - 1, max_row):
+                yield row, tuple(value or None for value in values)
+
+    @staticmethod
+    def write_ids(path: str, row_column_to_id: dict[tuple[int, int], str]) -> None:
+        with open(path, newline='', encoding='utf-8-sig') as file:
+            records = list(csv.reader(file, delimiter=settings.parser.csv_delimiter))
+        for (row, column), entity_id in row_column_to_id.items():
+            record = records[row - 1]
+            record.extend([''] * (column - len(record)))
+            record[column - 1] = entity_id
+
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file, delimiter=settings.parser.csv_delimiter).writerows(records)
+        os.replace(temporary_path, path)
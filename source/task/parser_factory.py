@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from task.parser_csv_service import ParserCsvService
+from task.parser_ndjson_service import ParserNdjsonService
+from task.parser_service import ParserService
+from task.parser_xlsx_service import ParserXlsxService
+
+
+EXTENSION_TO_PARSER: dict[str, type[ParserService]] = {
+    '.xlsx': ParserXlsxService,
+    '.csv': ParserCsvService,
+    '.ndjson': ParserNdjsonService,
+    '.jsonl': ParserNdjsonService,
+}
+
+
+def construct_parser(file_path: str | Path) -> ParserService:
+    extension = Path(file_path).suffix.lower()
+    if extension not in EXTENSION_TO_PARSER:
+        raise ValueError(f'unsupported menu file {file_path}, expected one of {", ".join(EXTENSION_TO_PARSER)}')
+    return EXTENSION_TO_PARSER[extension]()
+
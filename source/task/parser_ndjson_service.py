@@ -0,0 +1,43 @@
+import json
+import os
+from itertools import islice
+from typing import Iterator
+
+from task.parser_service import ROW_LAYOUTS, ParserService
+
+
+ENTITY_TYPE_TO_LAYOUT = dict(zip(('menu', 'submenu', 'dish'), ROW_LAYOUTS))
+
+
+class ParserNdjsonService(ParserService):
+    # One object per line with a "type" of menu, submenu or dish and the fields of that entity.
+    # Like the rows of the sheet, a submenu belongs to the menu above it and a dish to the submenu above it.
+    def read_rows(self, min_row: int = 1, max_row: int | None = None) -> Iterator[tuple[int, tuple]]:
+        with open(self.path, encoding='utf-8') as file:
+            for row, line in islice(enumerate(file, start=1), min_row - 1, max_row):
+                if line.strip():
+                    yield row, self.construct_row(row, json.loads(line))
+
+    @staticmethod
+    def construct_row(row: int, entity: dict) -> tuple:
+        if (layout := ENTITY_TYPE_TO_LAYOUT.get(entity.get('type'))) is None:
+            raise ValueError(f'line {row}: type must be one of {", ".join(ENTITY_TYPE_TO_LAYOUT)}')
+        _, column_type = layout
+        # The fields are laid out in the columns of the sheet, so the row goes through the same parse.
+        values = [None] * max(column_type)
+        for column in column_type:
+            values[column - 1] = entity.get(column.name.lower())
+        # The type already tells the level, so a line without an id is marked for the id resolver like a sheet row.
+        values[column_type.ID - 1] = values[column_type.ID - 1] or 'new'
+        return tuple(values)
+
+    @staticmethod
+    def write_ids(path: str, row_column_to_id: dict[tuple[int, int], str]) -> None:
+        row_to_id = {row: entity_id for (row, _), entity_id in row_column_to_id.items()}
+        temporary_path = f'{path}.tmp'
+        with open(path, encoding='utf-8') as source, open(temporary_path, 'w', encoding='utf-8') as target:
+            for row, line in enumerate(source, start=1):
+                if row in row_to_id:
+                    line = json.dumps({**json.loads(line), 'id': row_to_id[row]}, ensure_ascii=False) + '\n'
+                target.write(line)
+        os.replace(temporary_path, path)
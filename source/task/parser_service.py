@@ -0,0 +1,207 @@
+import hashlib
+import os
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Iterable, Iterator
+
+from pydantic import BaseModel
+
+from core.config import settings
+from database.schemas import MenuCreation, SubmenuCreation, DishCreation
+from task.id_resolver import IdResolver, construct_id_resolver
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class RestaurantMenu:
+    menu_id_to_menu: dict[str, MenuCreation] = field(default_factory=dict)
+    menu_id_submenu_id_to_submenu: dict[tuple[str, ...], SubmenuCreation] = field(default_factory=dict)
+    menu_id_submenu_id_dish_id_to_dish: dict[tuple[str, ...], DishCreation] = field(default_factory=dict)
+
+    def get_key_to_entity(self) -> dict[tuple[str, ...], BaseModel]:
+        # The length of a key tells the level: (menu_id,), (menu_id, submenu_id) or (menu_id, submenu_id, dish_id).
+        return {
+            **{(menu_id,): menu for menu_id, menu in self.menu_id_to_menu.items()},
+            **self.menu_id_submenu_id_to_submenu,
+            **self.menu_id_submenu_id_dish_id_to_dish,
+        }
+
+    def update(self, other: 'RestaurantMenu') -> None:
+        self.menu_id_to_menu.update(other.menu_id_to_menu)
+        self.menu_id_submenu_id_to_submenu.update(other.menu_id_submenu_id_to_submenu)
+        self.menu_id_submenu_id_dish_id_to_dish.update(other.menu_id_submenu_id_dish_id_to_dish)
+
+
+class ColumnMenu(IntEnum):
+    ID = 1
+    TITLE = 2
+    DESCRIPTION = 3
+
+
+class ColumnSubmenu(IntEnum):
+    ID = 2
+    TITLE = 3
+    DESCRIPTION = 4
+
+
+class ColumnDish(IntEnum):
+    ID = 3
+    TITLE = 4
+    DESCRIPTION = 5
+    PRICE = 6
+    DISCOUNT = 7
+
+
+# A row is matched against the layouts in this order, so a menu row is never taken for a submenu.
+ROW_LAYOUTS = (
+    (MenuCreation, ColumnMenu),
+    (SubmenuCreation, ColumnSubmenu),
+    (DishCreation, ColumnDish),
+)
+
+
+class ParserService(ABC):
+    # Every format is read as numbered rows in the column layout of the sheet, so the rows turn into
+    # a RestaurantMenu and get their missing ids the same way whatever file they came from.
+    def __init__(self, id_mode: str = settings.parser.id_mode) -> None:
+        self.path: str | None = None
+        self.hash_file: str | None = None
+        self.file_stat: tuple[int, int] | None = None
+        self.id_mode = id_mode
+        self.id_resolver: IdResolver | None = None
+
+    def load_file(self, path: str) -> None:
+        self.path = path
+        self.id_resolver = construct_id_resolver(self.id_mode, path, self.write_ids)
+
+    @abstractmethod
+    def read_rows(self, min_row: int = 1, max_row: int | None = None) -> Iterator[tuple[int, tuple]]:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def write_ids(path: str, row_column_to_id: dict[tuple[int, int], str]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def get_restaurant_menu(self) -> RestaurantMenu:
+        try:
+            restaurant_menu = self.collect_rows(self.read_rows())
+        finally:
+            self.close()
+        await self._flush_ids()
+        return restaurant_menu
+
+    async def merge_parsed(self, path: str, results: list[tuple[RestaurantMenu, IdResolver]]) -> RestaurantMenu:
+        # Parses off the event loop only generate the ids, they are merged here and written once for the whole file.
+        self.path, (restaurant_menu, self.id_resolver) = path, results[0]
+        for partial_menu, id_resolver in results[1:]:
+            restaurant_menu.update(partial_menu)
+            self.id_resolver.merge(id_resolver)
+        await self._flush_ids()
+        return restaurant_menu
+
+    @staticmethod
+    async def generate_hash(file_path: str, mode='rb') -> str:
+        hash_ = hashlib.sha256()
+        with open(file_path, mode) as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                hash_.update(chunk)
+        return hash_.hexdigest()
+
+    async def check_hash_file(self, file_path: str, mode='rb') -> bool:
+        # An unchanged mtime and size is trusted, so the file is only read once it was written to.
+        file_stat = self.get_file_stat(file_path)
+        if self.hash_file is not None and file_stat == self.file_stat:
+            return False
+
+        hash_ = await self.generate_hash(file_path, mode)
+        self.file_stat = file_stat
+        if self.hash_file is None or self.hash_file != hash_:
+            self.hash_file = hash_
+            return True
+        return False
+
+    @staticmethod
+    def get_file_stat(file_path: str) -> tuple[int, int]:
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def collect_rows(self, rows: Iterable[tuple[int, tuple]]) -> RestaurantMenu:
+        restaurant_menu = RestaurantMenu()
+        menu_id, submenu_id = None, None
+        title_path = ()
+        for row, values in rows:
+            values = (*values, *(None,) * (max(ColumnDish) - len(values)))
+            if (layout := self._classify_row(values)) is None:
+                continue
+            entity_type, column_type = layout
+            if entity_type is SubmenuCreation and not menu_id or entity_type is DishCreation and not submenu_id:
+                continue
+            # Parent titles are kept in the path, so the id resolvers can tell apart rows of different parents.
+            depth = ROW_LAYOUTS.index(layout)
+            entity_values = [values[column - 1] for column in column_type]
+            entity = self._build_entity(entity_type, row, column_type, entity_values, title_path[:depth])
+            title_path = (*title_path[:depth], entity.title)
+
+            if entity_type is MenuCreation:
+                menu_id, submenu_id = str(entity.id), None
+                restaurant_menu.menu_id_to_menu[menu_id] = entity
+            elif entity_type is SubmenuCreation:
+                submenu_id = str(entity.id)
+                restaurant_menu.menu_id_submenu_id_to_submenu[(menu_id, submenu_id)] = entity
+            else:
+                restaurant_menu.menu_id_submenu_id_dish_id_to_dish[(menu_id, submenu_id, str(entity.id))] = entity
+        return restaurant_menu
+
+    def _build_entity(self,
+                      entity_type: type[BaseModel],
+                      row: int,
+                      column_type: type[IntEnum],
+                      values: list,
+                      title_path: tuple[str, ...]) -> BaseModel:
+        if not self._check_uuid_4(values[0]):
+            values[0] = self.id_resolver.resolve(row, column_type.ID, (*title_path, str(values[1])))
+        return entity_type(**dict(zip(entity_type.model_fields, values)))
+
+    async def _flush_ids(self) -> None:
+        # Generated ids are persisted once per parse, however many rows were missing one.
+        if await self.id_resolver.flush():
+            self.hash_file = await self.generate_hash(self.path)
+            self.file_stat = self.get_file_stat(self.path)
+
+    @staticmethod
+    def _classify_row(values: tuple) -> tuple[type[BaseModel], type[IntEnum]] | None:
+        for entity_type, column_type in ROW_LAYOUTS:
+            # The last column of every layout is optional, the same way construct_entity treats it.
+            if all(values[column - 1] for column in list(column_type)[:-1]):
+                return entity_type, column_type
+        return None
+
+    @staticmethod
+    def _check_uuid_4(value: str) -> bool:
+        try:
+            uuid.UUID(str(value), version=4)
+            return True
+        except ValueError:
+            return False
+
+
+def parse_file(parser_type: type[ParserService],
+               path: str,
+               id_mode: str,
+               min_row: int = 1,
+               max_row: int | None = None) -> tuple[RestaurantMenu, IdResolver]:
+    # The one entry point of the parse pool and of the parse threads, for a whole file or the rows of a shard.
+    parser = parser_type(id_mode=id_mode)
+    parser.load_file(path)
+    try:
+        return parser.collect_rows(parser.read_rows(min_row, max_row)), parser.id_resolver
+    finally:
+        parser.close()
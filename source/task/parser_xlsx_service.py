@@ -1,112 +1,197 @@
-import hashlib
-import uuid
-from dataclasses import dataclass, field
+import asyncio
+import bisect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from enum import IntEnum
+from typing import Iterator
+from xml.etree.ElementTree import Element
 
 from openpyxl import load_workbook
 from openpyxl.workbook import Workbook
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+from openpyxl.worksheet._reader import ROW_TAG, WorkSheetParser
 from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.xml.functions import iterparse
 from pydantic import BaseModel
 
+from core.config import settings
 from database.schemas import MenuCreation, SubmenuCreation, DishCreation
+from task.parser_service import ColumnDish, ColumnMenu, ColumnSubmenu, ParserService, RestaurantMenu, parse_file
 
 
-@dataclass
-class RestaurantMenu:
-    menu_id_to_menu: dict[str, MenuCreation] = field(default_factory=dict)
-    menu_id_submenu_id_to_submenu: dict[tuple[str, ...], SubmenuCreation] = field(default_factory=dict)
-    menu_id_submenu_id_dish_id_to_dish: dict[tuple[str, ...], DishCreation] = field(default_factory=dict)
-
-
-class ColumnMenu(IntEnum):
-    ID = 1
-    TITLE = 2
-    DESCRIPTION = 3
-
-
-class ColumnSubmenu(IntEnum):
-    ID = 2
-    TITLE = 3
-    DESCRIPTION = 4
-
-
-class ColumnDish(IntEnum):
-    ID = 3
-    TITLE = 4
-    DESCRIPTION = 5
-    PRICE = 6
-    DISCOUNT = 7
-
-
-class ParserXlsxService:
-    def __init__(self) -> None:
+class ParserXlsxService(ParserService):
+    def __init__(self,
+                 streaming: bool = settings.parser.streaming,
+                 id_mode: str = settings.parser.id_mode,
+                 workers: int = settings.parser.workers) -> None:
+        super().__init__(id_mode)
         self.sheet:  Worksheet | None = None
         self.book: Workbook | None = None
-        self.path: str | None = None
-        self.hash_file: str | None = None
+        self.streaming = streaming
+        self.workers = workers
 
-    def load_sheet(self, path: str) -> None:
-        self.path = path
-        self.book = load_workbook(filename=path)
+    def load_file(self, path: str) -> None:
+        super().load_file(path)
+        self.book = load_workbook(filename=path, read_only=self.streaming)
         self.sheet = self.book.active
 
+    def read_rows(self, min_row: int = 1, max_row: int | None = None) -> Iterator[tuple[int, tuple]]:
+        if not isinstance(self.sheet, ReadOnlyWorksheet):
+            rows = self.sheet.iter_rows(min_row=min_row, max_row=max_row, max_col=max(ColumnDish), values_only=True)
+            return enumerate(rows, start=min_row)
+        return self.read_sheet_rows(min_row, max_row)
+
+    def read_sheet_rows(self, min_row: int, max_row: int | None) -> Iterator[tuple[int, tuple]]:
+        for row, element, worksheet_parser in iterate_row_elements(self.sheet):
+            if max_row is not None and row > max_row:
+                break
+            if row >= min_row:
+                yield row, parse_row_values(worksheet_parser, element, row)
+
     @staticmethod
-    async def generate_hash(file_path: str, mode='rb') -> str:
-        hash_ = hashlib.sha256()
-        with open(file_path, mode) as file:
-            hash_.update(file.read())
-        return hash_.hexdigest()
-
-    async def check_hash_file(self, file_path: str, mode='rb') -> bool:
-        hash_ = await self.generate_hash(file_path, mode)
-        if self.hash_file is None or self.hash_file != hash_:
-            self.hash_file = hash_
-            return True
-        return False
+    def write_ids(path: str, row_column_to_id: dict[tuple[int, int], str]) -> None:
+        book = load_workbook(filename=path)
+        for (row, column), entity_id in row_column_to_id.items():
+            book.active.cell(row=row, column=column).value = entity_id
+        book.save(path)
+
+    def close(self) -> None:
+        if self.book is not None and self.streaming:
+            self.book.close()
+        self.sheet = None
+        self.book = None
 
     async def construct_entity(self,
                          entity_type: type[BaseModel],
                          row: int,
                          column_type: type[IntEnum],
-                         entity_id: uuid.UUID = None) -> BaseModel | None:
-        cells = [self.sheet.cell(row=row, column=column) for column in column_type]
-        values = [cell.value for cell in cells]
+                         title_path: tuple[str, ...] = ()) -> BaseModel | None:
+        values = [self.sheet.cell(row=row, column=column).value for column in column_type]
         if not all(values[:-1]):
             return
-
-        if not self._check_uuid_4(values[0]):
-            values[0] = uuid.uuid4()
-            cells[0].value = str(values[0])
-            self.book.save(self.path)
-            self.hash_file = await self.generate_hash(self.path)
-        if entity_id is not None:
-            values.append(entity_id)
-        keys = entity_type.model_fields.keys()
-        return entity_type(**dict(zip(keys, values)))
+        return self._build_entity(entity_type, row, column_type, values, title_path)
 
     async def get_restaurant_menu(self) -> RestaurantMenu:
+        if self.streaming:
+            return await self.stream_restaurant_menu()
+
         restaurant_menu = RestaurantMenu()
         rows = iter(range(1, self.sheet.max_row + 1))
         menu_id, submenu_id = None, None
+        menu_title, submenu_title = None, None
         for row in rows:
             if menu := await self.construct_entity(MenuCreation, row, ColumnMenu):
-                menu_id = str(menu.id)
+                menu_id, menu_title = str(menu.id), menu.title
                 restaurant_menu.menu_id_to_menu[menu_id] = menu
                 row = next(rows)
-            if menu_id and (submenu := await self.construct_entity(SubmenuCreation, row, ColumnSubmenu, menu_id)):
-                submenu_id = str(submenu.id)
+            if menu_id and (
+                    submenu := await self.construct_entity(SubmenuCreation, row, ColumnSubmenu, (menu_title,))
+            ):
+                submenu_id, submenu_title = str(submenu.id), submenu.title
                 restaurant_menu.menu_id_submenu_id_to_submenu[(menu_id, submenu_id)] = submenu
                 row = next(rows)
-            if submenu_id and (dish := await self.construct_entity(DishCreation, row, ColumnDish, submenu_id)):
+            if submenu_id and (
+                    dish := await self.construct_entity(DishCreation, row, ColumnDish, (menu_title, submenu_title))
+            ):
                 restaurant_menu.menu_id_submenu_id_dish_id_to_dish[(menu_id, submenu_id, str(dish.id))] = dish
-        self.sheet = None
-        self.book = None
+        self.close()
+        await self._flush_ids()
         return restaurant_menu
 
-    @staticmethod
-    def _check_uuid_4(value: str) -> bool:
-        try:
-            uuid.UUID(value, version=4)
-            return True
-        except ValueError:
-            return False
+    async def stream_restaurant_menu(self) -> RestaurantMenu:
+        if self.workers:
+            return await self.parse_in_pool()
+        return await super().get_restaurant_menu()
+
+    async def parse_in_pool(self) -> RestaurantMenu:
+        # openpyxl and pydantic are CPU bound, so the shards of the sheet are parsed side by side in the pool.
+        # Every pool process opens the workbook itself and parses the rows of its own shard only.
+        self.close()
+        loop = asyncio.get_running_loop()
+        pool = get_parse_pool(self.workers)
+        row_ranges = [(1, None)] if self.workers < 2 else (
+            await loop.run_in_executor(pool, find_row_ranges, self.path, self.workers)
+        )
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, parse_file, ParserXlsxService, self.path, self.id_mode, min_row, max_row)
+            for min_row, max_row in row_ranges
+        ))
+        return await self.merge_parsed(self.path, list(results))
+
+
+_parse_pool: ProcessPoolExecutor | None = None
+
+
+def get_parse_pool(workers: int) -> ProcessPoolExecutor:
+    global _parse_pool
+    if multiprocessing.current_process().daemon:
+        # Processes of the Celery prefork pool are daemonic and may not start children of their own.
+        raise RuntimeError('XLSX_PARSE_WORKERS needs a process allowed to fork, run the Celery worker with --pool=solo')
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=workers)
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown()
+        _parse_pool = None
+
+
+def iterate_row_elements(sheet: ReadOnlyWorksheet) -> Iterator[tuple[int, Element, WorkSheetParser]]:
+    # openpyxl parses every cell of the rows it passes over, the rows in front of min_row as well. Passing over
+    # the raw XML elements costs a fraction of that, so a row is only parsed by the one who needs its values.
+    with sheet._get_source() as source:
+        worksheet_parser = WorkSheetParser(
+            source,
+            sheet._shared_strings,
+            data_only=sheet.parent.data_only,
+            epoch=sheet.parent.epoch,
+            date_formats=sheet.parent._date_formats,
+            timedelta_formats=sheet.parent._timedelta_formats,
+        )
+        row = 0
+        for _, element in iterparse(source):
+            if element.tag == ROW_TAG:
+                row = int(element.get('r', row + 1))
+                yield row, element, worksheet_parser
+                element.clear()
+
+
+def parse_row_values(worksheet_parser: WorkSheetParser, element: Element, row: int) -> tuple:
+    # Cells without a reference are numbered from the row the parser stands on.
+    worksheet_parser.row_counter = row - 1
+    _, cells = worksheet_parser.parse_row(element)
+    values = [None] * max(ColumnDish)
+    for cell in cells:
+        if cell['column'] <= len(values):
+            values[cell['column'] - 1] = cell['value']
+    return tuple(values)
+
+
+def find_row_ranges(path: str, shards: int) -> list[tuple[int, int | None]]:
+    # Runs in a pool process. Shards start on menu rows, so every shard knows the parents of its rows.
+    book = load_workbook(filename=path, read_only=True)
+    try:
+        menu_rows, last_row = [], 0
+        for last_row, element, worksheet_parser in iterate_row_elements(book.active):
+            # Only a menu row has a value in column A, the other rows are passed over without parsing a cell.
+            cell = next(iter(element), None)
+            reference = 'A1' if cell is None else cell.get('r', 'A1')
+            if cell is None or not len(cell) or reference[0] != 'A' or not reference[1].isdigit():
+                continue
+            values = parse_row_values(worksheet_parser, element, last_row)
+            if ParserService._classify_row(values) == (MenuCreation, ColumnMenu):
+                menu_rows.append(last_row)
+    finally:
+        book.close()
+
+    if not menu_rows:
+        return [(1, None)]
+    starts, shard_rows = [menu_rows[0]], (last_row + 1 - menu_rows[0]) / shards
+    for shard in range(1, shards):
+        index = bisect.bisect_left(menu_rows, menu_rows[0] + shard_rows * shard)
+        if index < len(menu_rows) and menu_rows[index] > starts[-1]:
+            starts.append(menu_rows[index])
+    return list(zip(starts, [*(start - 1 for start in starts[1:]), None]))
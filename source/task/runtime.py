@@ -0,0 +1,38 @@
+import asyncio
+import threading
+from typing import Any, Coroutine
+
+
+class AsyncRuntime:
+    # One event loop per worker process, so pooled connections survive from one task to the next.
+    # The loop and the pools bound to it belong to the thread that started it, which rules out --pool=threads.
+    def __init__(self) -> None:
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread_id: int | None = None
+
+    def start(self) -> None:
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread_id = threading.get_ident()
+            asyncio.set_event_loop(self.loop)
+
+    def run(self, coroutine: Coroutine) -> Any:
+        self.start()
+        if threading.get_ident() != self.thread_id:
+            coroutine.close()
+            raise RuntimeError('the event loop belongs to another thread, run the Celery worker with --pool=solo')
+        return self.loop.run_until_complete(coroutine)
+
+    def stop(self, cleanup: Coroutine | None = None) -> None:
+        if self.loop is None:
+            if cleanup is not None:
+                cleanup.close()
+            return
+        try:
+            if cleanup is not None:
+                self.loop.run_until_complete(cleanup)
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        finally:
+            self.loop.close()
+            asyncio.set_event_loop(None)
+            self.loop, self.thread_id = None, None
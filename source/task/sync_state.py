@@ -0,0 +1,34 @@
+from redis import asyncio as aioredis
+
+from core.config import settings
+from database.redis_cache import RedisCache
+from task.parser_service import ParserService
+
+
+class FileStateStore:
+    # The last synced hash and stat of a menu file, kept in Redis so a restarted worker does not resync.
+    def __init__(self, redis_connection: aioredis.Redis | None = None, key: str = settings.sync.file_state_key):
+        self.redis_connection = redis_connection or RedisCache.redis_connection
+        self.key = key
+
+    async def restore(self, parser: ParserService, file_path: str) -> None:
+        state = await self.redis_connection.hgetall(self._construct_key(file_path))
+        if state:
+            parser.hash_file = state[b'hash'].decode()
+            parser.file_stat = int(state[b'mtime_ns']), int(state[b'size'])
+
+    async def save(self, parser: ParserService, file_path: str) -> None:
+        await self.save_state(file_path, parser.hash_file, parser.file_stat)
+
+    async def save_state(self, file_path: str, hash_file: str, file_stat: tuple[int, int]) -> None:
+        mtime_ns, size = file_stat
+        await self.redis_connection.hset(
+            self._construct_key(file_path), mapping={'hash': hash_file, 'mtime_ns': mtime_ns, 'size': size}
+        )
+
+    async def clear(self, parser: ParserService, file_path: str) -> None:
+        parser.hash_file, parser.file_stat = None, None
+        await self.redis_connection.delete(self._construct_key(file_path))
+
+    def _construct_key(self, file_path: str) -> str:
+        return f'{self.key}:{file_path}'
@@ -1,33 +1,188 @@
 import asyncio
 from datetime import timedelta
 
-from celery import Celery
+from celery import Celery, chord, group
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
 
 from core.config import settings
+from core.tracing import close_tracing, setup_tracing
+from database.redis_cache import RedisCache
+from database.session_manager import close_engine, engine, sessionmaker
+from repository.restaurant_repository import RestaurantRepository
+from service.restaurant_service import RestaurantService
+from task.db_admin_restaurant import DbAdminRestaurant
+from task.fingerprint_index import FingerprintIndex
 from task.http_client_admin_restaurant import HttpClientAdminRestaurant
-from task.parser_xlsx_service import ParserXlsxService
+from task.menu_directory import MenuDirectory, MenuFile
+from task.parser_factory import construct_parser
+from task.parser_service import RestaurantMenu
+from task.parser_xlsx_service import shutdown_parse_pool
+from task.runtime import AsyncRuntime
+from task.sync_state import FileStateStore
 
 
-celery = Celery(main='restaurant', broker=settings.celery.broker_url)
+celery = Celery(main='restaurant', broker=settings.celery.broker_url, backend=settings.celery.result_backend)
 
 celery.conf.beat_schedule = {
     'load_menu': {
         'task': 'load_menu',
         'schedule': timedelta(seconds=15),
     },
-}
+} if settings.sync.trigger == 'beat' else {}
 
-parser = ParserXlsxService()
+parser = construct_parser(settings.file_path)
+
+client = DbAdminRestaurant() if settings.sync.backend == 'db' else HttpClientAdminRestaurant()
+
+fingerprint_index = FingerprintIndex()
+
+file_state = FileStateStore()
+
+# Files only own the menus they list, the backends that replace the whole catalog would drop the others.
+# Checked when the worker imports the tasks, a retried load_menu would only fail the same way every time.
+if settings.menu_dir and settings.sync.backend != 'http':
+    raise ValueError(f'MENU_DIR is synced through the http backend only, SYNC_BACKEND is {settings.sync.backend!r}')
+
+menu_directory = MenuDirectory(settings.menu_dir) if settings.menu_dir else None
+
+runtime = AsyncRuntime()
+
+
+@worker_process_init.connect
+def start_runtime(**kwargs) -> None:
+    # Pools inherited from the parent process must not be shared with it after the fork.
+    engine.sync_engine.dispose(close=False)
+    RedisCache.redis_connection.connection_pool.reset()
+    setup_tracing(engine)
+    runtime.start()
+    if isinstance(client, HttpClientAdminRestaurant):
+        runtime.run(client.open())
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_runtime(**kwargs) -> None:
+    runtime.stop(_close_resources())
+    close_tracing()
+
+
+async def _close_resources() -> None:
+    if isinstance(client, HttpClientAdminRestaurant):
+        await client.aclose()
+    await close_engine()
+    await RedisCache.close()
+    shutdown_parse_pool()
 
-client = HttpClientAdminRestaurant()
 
 async def _load_menu() -> str:
-    if not await parser.check_hash_file(settings.file_path):
+    lock_token = await RedisCache.acquire_lock(settings.sync.lock_key, settings.sync.lock_ttl_ms)
+    if lock_token is None:
+        return 'Menu is being synced by another run'
+
+    dispatched = False
+    try:
+        if menu_directory is not None:
+            return await _load_menu_directory()
+
+        file_path = str(settings.file_path)
+        if parser.hash_file is None:
+            await file_state.restore(parser, file_path)
+        if not await parser.check_hash_file(file_path):
+            return 'Menu has not been changed'
+
+        try:
+            parser.load_file(file_path)
+            menu = await parser.get_restaurant_menu()
+            if settings.sync.backend == 'tree':
+                await client.push_restaurant_menu_tree(menu)
+            elif isinstance(client, HttpClientAdminRestaurant) and settings.sync.fan_out:
+                await _dispatch_subtrees(menu, file_path, lock_token)
+                dispatched = True
+                return 'Menu update dispatched'
+            elif isinstance(client, HttpClientAdminRestaurant) and settings.sync.incremental:
+                await client.load_restaurant_menu_changes(menu, fingerprint_index)
+            else:
+                await client.load_restaurant_menu_in_db(menu)
+        except Exception:
+            # Forgetting the hash makes the retry sync the file again instead of reporting it as unchanged.
+            await file_state.clear(parser, file_path)
+            raise
+        await file_state.save(parser, file_path)
+        return 'Menu update successfully'
+    finally:
+        # A dispatched run keeps the lock until finalize_sync or the error callback releases it.
+        if not dispatched:
+            await RedisCache.release_lock(settings.sync.lock_key, lock_token)
+
+
+async def _load_menu_directory() -> str:
+    changed_files = await menu_directory.find_changed_files(file_state)
+    removed_file_paths = await menu_directory.find_removed_files()
+    if not changed_files and not removed_file_paths:
         return 'Menu has not been changed'
-    parser.load_sheet(settings.file_path)
-    menu = await parser.get_restaurant_menu()
-    await client.load_restaurant_menu_in_db(menu)
-    return 'Menu update successfully'
+
+    async with client.session():
+        results = await asyncio.gather(
+            *(_sync_menu_file(menu_file) for menu_file in changed_files),
+            *(_remove_menu_file(file_path) for file_path in removed_file_paths),
+            return_exceptions=True,
+        )
+    # Files that failed are retried on their own, the synced ones are unchanged by then and skipped.
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return f'Menu update successfully: {len(changed_files)} changed, {len(removed_file_paths)} removed'
+
+
+async def _sync_menu_file(menu_file: MenuFile) -> None:
+    try:
+        menu = await menu_directory.parse(menu_file)
+        await client.load_restaurant_menu_changes(menu, menu_file.fingerprint_index, owns_all_menus=False)
+    except Exception:
+        await file_state.clear(menu_file.parser, menu_file.path)
+        raise
+    await file_state.save(menu_file.parser, menu_file.path)
+    await menu_directory.add_file(menu_file.path)
+
+
+async def _remove_menu_file(file_path: str) -> None:
+    fingerprint_index = menu_directory.construct_fingerprint_index(file_path)
+    change_set = fingerprint_index.diff(await fingerprint_index.load(), {})
+    await client.apply_changes(RestaurantMenu(), change_set)
+    await fingerprint_index.clear()
+    await file_state.clear(menu_directory.get_menu_file(file_path).parser, file_path)
+    await menu_directory.remove_file(file_path)
+
+
+async def _dispatch_subtrees(menu: RestaurantMenu, file_path: str, lock_token: str) -> None:
+    deleted_menu_ids = await client.load_menus(menu)
+    header = group(sync_subtree.s(menu_tree) for menu_tree in client.construct_tree(menu))
+    body = finalize_sync.s(
+        file_path=file_path,
+        hash_file=parser.hash_file,
+        file_stat=parser.file_stat,
+        fingerprints=fingerprint_index.construct_fingerprints(menu),
+        menu_ids=[*menu.menu_id_to_menu, *deleted_menu_ids],
+        lock_token=lock_token,
+    )
+    chord(header)(body.on_error(release_sync_lock.si(lock_token)))
+    # The file counts as synced only once finalize_sync stores its state, the next run reads it back from there.
+    parser.hash_file, parser.file_stat = None, None
+
+
+async def _finalize_sync(file_path: str,
+                         hash_file: str,
+                         file_stat: tuple[int, int],
+                         fingerprints: dict[str, str],
+                         menu_ids: list[str],
+                         lock_token: str) -> None:
+    try:
+        async with sessionmaker() as session:
+            await RestaurantService(RestaurantRepository(session), RedisCache()).delete_catalog_cache(set(menu_ids))
+        await fingerprint_index.save(fingerprints)
+        await file_state.save_state(file_path, hash_file, tuple(file_stat))
+    finally:
+        await RedisCache.release_lock(settings.sync.lock_key, lock_token)
 
 
 @celery.task(
@@ -39,6 +194,35 @@ async def _load_menu() -> str:
 )
 def load_menu(self):
     try:
-        return asyncio.run(_load_menu())
+        return runtime.run(_load_menu())
     except Exception as error:
         self.retry(exc=error)
+
+
+@celery.task(name='sync_subtree', bind=True, default_retry_delay=15, max_retries=3)
+def sync_subtree(self, menu_tree: dict) -> dict:
+    restaurant_menu = client.construct_restaurant_menu([menu_tree])
+    try:
+        runtime.run(client.load_subtree(restaurant_menu))
+    except Exception as error:
+        raise self.retry(exc=error)
+    return {
+        'menu_id': menu_tree['id'],
+        'submenus': len(restaurant_menu.menu_id_submenu_id_to_submenu),
+        'dishes': len(restaurant_menu.menu_id_submenu_id_dish_id_to_dish),
+    }
+
+
+@celery.task(name='finalize_sync')
+def finalize_sync(results: list[dict], **kwargs) -> dict:
+    runtime.run(_finalize_sync(**kwargs))
+    return {
+        'menus': len(results),
+        'submenus': sum(result['submenus'] for result in results),
+        'dishes': sum(result['dishes'] for result in results),
+    }
+
+
+@celery.task(name='release_sync_lock')
+def release_sync_lock(lock_token: str) -> None:
+    runtime.run(RedisCache.release_lock(settings.sync.lock_key, lock_token))
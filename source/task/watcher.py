@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import AsyncIterator
+
+from core.config import settings
+from task.parser_factory import EXTENSION_TO_PARSER
+from task.parser_service import ParserService
+from task.task import load_menu
+
+try:
+    from watchfiles import Change, awatch
+except ImportError:
+    awatch = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def use_file_events() -> bool:
+    if settings.sync.watch_polling:
+        return False
+    if awatch is None:
+        raise RuntimeError('watchfiles is not installed, install it or set SYNC_WATCH_POLLING=true to poll the files')
+    return True
+
+
+async def watch_file(file_path: Path, debounce_ms: int) -> AsyncIterator[None]:
+    if use_file_events():
+        # Editors often save through a temporary file and a rename, which shows up as an added file.
+        def is_file_saved(change: 'Change', path: str) -> bool:
+            return change != Change.deleted and Path(path) == file_path
+
+        async for _ in awatch(file_path.parent, watch_filter=is_file_saved, debounce=debounce_ms, recursive=False):
+            yield
+        return
+
+    # The file is polled by stat and reported once it stayed unchanged for a whole interval.
+    logger.info('Polling %s every %s ms', file_path, debounce_ms)
+    file_stat, pending_stat = ParserService.get_file_stat(str(file_path)), None
+    while True:
+        await asyncio.sleep(debounce_ms / 1000)
+        try:
+            current_stat = ParserService.get_file_stat(str(file_path))
+        except FileNotFoundError:
+            continue
+        if current_stat != file_stat and current_stat == pending_stat:
+            file_stat = current_stat
+            yield
+        pending_stat = current_stat
+
+
+async def watch_directory(directory: Path, debounce_ms: int) -> AsyncIterator[None]:
+    # Deleted files count as well here, the sync removes the menus they owned.
+    if use_file_events():
+        async for _ in awatch(directory, watch_filter=is_menu_file, debounce=debounce_ms, recursive=False):
+            yield
+        return
+
+    logger.info('Polling %s every %s ms', directory, debounce_ms)
+    file_stats, pending_stats = get_directory_stats(directory), None
+    while True:
+        await asyncio.sleep(debounce_ms / 1000)
+        current_stats = get_directory_stats(directory)
+        if current_stats != file_stats and current_stats == pending_stats:
+            file_stats = current_stats
+            yield
+        pending_stats = current_stats
+
+
+def is_menu_file(change: 'Change', path: str) -> bool:
+    return Path(path).suffix.lower() in EXTENSION_TO_PARSER
+
+
+def get_directory_stats(directory: Path) -> dict[str, tuple[int, int]]:
+    file_path_to_stat = {}
+    for file_path in directory.iterdir():
+        if file_path.suffix.lower() in EXTENSION_TO_PARSER:
+            try:
+                file_path_to_stat[str(file_path)] = ParserService.get_file_stat(str(file_path))
+            except FileNotFoundError:
+                pass
+    return file_path_to_stat
+
+
+async def watch() -> None:
+    if settings.sync.trigger != 'watch':
+        # The watcher service always starts, SYNC_TRIGGER alone decides whether beat or the watcher syncs.
+        logger.info('SYNC_TRIGGER is %r, the sync is triggered by beat', settings.sync.trigger)
+        return
+
+    if settings.menu_dir:
+        directory = Path(settings.menu_dir).absolute()
+        logger.info('Watching %s', directory)
+        load_menu.delay()
+        async for _ in watch_directory(directory, settings.sync.watch_debounce_ms):
+            load_menu.delay()
+        return
+
+    file_path = Path(settings.file_path).absolute()
+    logger.info('Watching %s', file_path)
+    load_menu.delay()
+    async for _ in watch_file(file_path, settings.sync.watch_debounce_ms):
+        if os.path.exists(file_path):
+            load_menu.delay()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(watch())
@@ -0,0 +1,88 @@
+import asyncio
+import copy
+import json
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+from core.config import settings
+from database.schemas import Dish, Menu, Submenu
+
+
+# Response schema and parent id field of every depth of the tree.
+DEPTH_TO_SCHEMA = ((Menu, None), (Submenu, 'menu_id'), (Dish, 'submenu_id'))
+
+
+class FakeRestaurantApi:
+    # The routes and response bodies of the API kept in memory, so the tests and the sync benchmark exercise
+    # the sync client and count its requests without a database. The latency stands for the round trip
+    # to a real server.
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.key_to_entity: dict[tuple[str, ...], dict] = {}
+        self.parent_to_keys: defaultdict[tuple[str, ...], dict[tuple[str, ...], None]] = defaultdict(dict)
+        self.method_to_count: Counter[str] = Counter()
+
+    def construct_transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def snapshot(self) -> tuple[dict, defaultdict]:
+        return copy.deepcopy((self.key_to_entity, self.parent_to_keys))
+
+    def restore(self, snapshot: tuple[dict, defaultdict]) -> None:
+        self.key_to_entity, self.parent_to_keys = copy.deepcopy(snapshot)
+
+    def count_requests(self) -> dict[str, int]:
+        method_to_count = dict(self.method_to_count)
+        self.method_to_count.clear()
+        return method_to_count
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.method_to_count[request.method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        # /menus, /menus/{id}, /menus/{id}/submenus, ... : ids sit at the even positions after /menus.
+        parts = [part for part in request.url.path.removeprefix(settings.url.target_menus).split('/') if part]
+        key, is_collection = tuple(parts[::2]), len(parts) % 2 == 0
+        if is_collection and request.method == 'GET':
+            return httpx.Response(200, json=[self.render(child) for child in self.parent_to_keys.get(key, ())])
+        if is_collection and request.method == 'POST':
+            return self.post(key, json.loads(request.content))
+        if key not in self.key_to_entity:
+            return httpx.Response(404, json={'detail': 'not found'})
+        if request.method == 'GET':
+            return httpx.Response(200, json=self.render(key))
+        if request.method == 'PATCH':
+            self.key_to_entity[key].update(json.loads(request.content))
+            return httpx.Response(200, json=self.render(key))
+        if request.method == 'DELETE':
+            self.delete(key)
+            return httpx.Response(200, json={'status': True})
+        return httpx.Response(405)
+
+    def post(self, parent: tuple[str, ...], entity: dict) -> httpx.Response:
+        if parent and parent not in self.key_to_entity:
+            return httpx.Response(404, json={'detail': 'not found'})
+        key = (*parent, entity.get('id') or str(uuid.uuid4()))
+        if key in self.key_to_entity:
+            return httpx.Response(400, json={'detail': 'already exists'})
+        self.key_to_entity[key] = {**entity, 'id': key[-1]}
+        self.parent_to_keys[parent][key] = None
+        return httpx.Response(201, json=self.render(key))
+
+    def delete(self, key: tuple[str, ...]) -> None:
+        # The children go first, the way the cascade of the foreign keys drops them.
+        for child in list(self.parent_to_keys.get(key, ())):
+            self.delete(child)
+        self.parent_to_keys.pop(key, None)
+        del self.key_to_entity[key]
+        self.parent_to_keys[key[:-1]].pop(key)
+
+    def render(self, key: tuple[str, ...]) -> dict:
+        schema, parent_field = DEPTH_TO_SCHEMA[len(key) - 1]
+        entity = self.key_to_entity[key]
+        if parent_field is not None:
+            entity = {**entity, parent_field: key[-2]}
+        return schema.model_validate(entity).model_dump(mode='json')
@@ -0,0 +1,72 @@
+import uuid
+
+from task.fingerprint_index import ChangeSet, FingerprintIndex
+from task.http_client_admin_restaurant import HttpClientAdminRestaurant
+from task.parser_service import RestaurantMenu
+
+
+MENU_ID, SUBMENU_ID, OTHER_SUBMENU_ID = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+
+DISH_ID, OTHER_DISH_ID = str(uuid.uuid4()), str(uuid.uuid4())
+
+
+def construct_restaurant_menu(dishes: dict[str, list[dict]]) -> RestaurantMenu:
+    return HttpClientAdminRestaurant.construct_restaurant_menu([{
+        'id': MENU_ID,
+        'title': 'Menu',
+        'description': 'Menu description',
+        'submenus': [
+            {'id': submenu_id, 'title': f'Submenu {submenu_id}', 'description': 'Submenu description', 'dishes': dishes}
+            for submenu_id, dishes in dishes.items()
+        ],
+    }])
+
+
+def construct_dish(dish_id: str, price: str = '10.00') -> dict:
+    return {'id': dish_id, 'title': f'Dish {dish_id}', 'description': 'Dish description', 'price': price}
+
+
+def diff(previous: RestaurantMenu, current: RestaurantMenu) -> ChangeSet:
+    return FingerprintIndex.diff(
+        FingerprintIndex.construct_fingerprints(previous), FingerprintIndex.construct_fingerprints(current)
+    )
+
+
+def test_unchanged_menu_gives_empty_change_set():
+    restaurant_menu = construct_restaurant_menu({SUBMENU_ID: [construct_dish(DISH_ID)]})
+
+    change_set = diff(restaurant_menu, construct_restaurant_menu({SUBMENU_ID: [construct_dish(DISH_ID)]}))
+
+    assert change_set.is_empty
+
+
+def test_diff_finds_added_changed_and_removed_entities():
+    previous = construct_restaurant_menu({SUBMENU_ID: [construct_dish(DISH_ID)], OTHER_SUBMENU_ID: []})
+    current = construct_restaurant_menu({SUBMENU_ID: [construct_dish(DISH_ID, '12.50'), construct_dish(OTHER_DISH_ID)]})
+
+    change_set = diff(previous, current)
+
+    assert change_set.added == [(MENU_ID, SUBMENU_ID, OTHER_DISH_ID)]
+    assert change_set.changed == [(MENU_ID, SUBMENU_ID, DISH_ID)]
+    assert change_set.removed == [(MENU_ID, OTHER_SUBMENU_ID)]
+    assert not change_set.is_empty
+
+
+def test_dish_moved_to_another_submenu_is_removed_and_added():
+    previous = construct_restaurant_menu({SUBMENU_ID: [construct_dish(DISH_ID)], OTHER_SUBMENU_ID: []})
+    current = construct_restaurant_menu({SUBMENU_ID: [], OTHER_SUBMENU_ID: [construct_dish(DISH_ID)]})
+
+    change_set = diff(previous, current)
+
+    assert change_set.added == [(MENU_ID, OTHER_SUBMENU_ID, DISH_ID)]
+    assert change_set.removed == [(MENU_ID, SUBMENU_ID, DISH_ID)]
+    assert change_set.changed == []
+
+
+def test_diff_against_nothing_removes_everything():
+    previous = construct_restaurant_menu({SUBMENU_ID: [construct_dish(DISH_ID)]})
+
+    change_set = FingerprintIndex.diff(FingerprintIndex.construct_fingerprints(previous), {})
+
+    assert sorted(change_set.removed) == sorted(previous.get_key_to_entity())
+    assert change_set.added == change_set.changed == []
@@ -0,0 +1,136 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+
+from task.fingerprint_index import FingerprintIndex
+from task.http_client_admin_restaurant import HttpClientAdminRestaurant
+from task.parser_service import RestaurantMenu
+from tests.fake_restaurant_api import FakeRestaurantApi
+
+
+MENU_ID = str(uuid.uuid4())
+
+SUBMENU_ID, REMOVED_SUBMENU_ID, ADDED_SUBMENU_ID = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+
+DISH_ID, OTHER_DISH_ID, REMOVED_DISH_ID, ADDED_DISH_ID = (str(uuid.uuid4()) for _ in range(4))
+
+
+class RecordingRestaurantApi(FakeRestaurantApi):
+    def __init__(self, failing_request: tuple[str, str] | None = None) -> None:
+        super().__init__()
+        self.failing_request = failing_request
+        self.sent: list[tuple[str, str]] = []
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.sent.append((request.method, request.url.path))
+        if (request.method, request.url.path) == self.failing_request:
+            return httpx.Response(422, json={'detail': 'invalid'})
+        return await super().handle(request)
+
+
+class InMemoryFingerprintIndex(FingerprintIndex):
+    def __init__(self) -> None:
+        super().__init__(redis_connection=object())
+        self.fingerprints: dict[str, str] = {}
+
+    async def load(self) -> dict[str, str]:
+        return dict(self.fingerprints)
+
+    async def save(self, fingerprints: dict[str, str]) -> None:
+        self.fingerprints = dict(fingerprints)
+
+    async def clear(self) -> None:
+        self.fingerprints = {}
+
+
+def construct_restaurant_menu(submenu_id_to_dish_ids: dict[str, list[str]], price: str = '10.00') -> RestaurantMenu:
+    return HttpClientAdminRestaurant.construct_restaurant_menu([{
+        'id': MENU_ID,
+        'title': 'Menu',
+        'description': 'Menu description',
+        'submenus': [
+            {
+                'id': submenu_id,
+                'title': f'Submenu {submenu_id}',
+                'description': 'Submenu description',
+                'dishes': [
+                    {'id': dish_id, 'title': f'Dish {dish_id}', 'description': 'Dish description', 'price': price}
+                    for dish_id in dish_ids
+                ],
+            }
+            for submenu_id, dish_ids in submenu_id_to_dish_ids.items()
+        ],
+    }])
+
+
+def construct_url(*key: str) -> str:
+    return HttpClientAdminRestaurant._construct_urls(key)[1]
+
+
+def construct_collection_url(*key: str) -> str:
+    return HttpClientAdminRestaurant._construct_urls(key)[0]
+
+
+def test_apply_changes_deletes_first_and_posts_parents_before_children():
+    api = RecordingRestaurantApi()
+    client = HttpClientAdminRestaurant(transport=api.construct_transport())
+    fingerprint_index = InMemoryFingerprintIndex()
+    previous = construct_restaurant_menu({SUBMENU_ID: [DISH_ID], REMOVED_SUBMENU_ID: [REMOVED_DISH_ID]})
+    asyncio.run(client.load_restaurant_menu_changes(previous, fingerprint_index))
+    api.sent.clear()
+
+    current = construct_restaurant_menu({SUBMENU_ID: [DISH_ID], ADDED_SUBMENU_ID: [ADDED_DISH_ID]}, price='12.50')
+    asyncio.run(client.load_restaurant_menu_changes(current, fingerprint_index))
+
+    assert api.sent[0] == ('DELETE', construct_url(MENU_ID, REMOVED_SUBMENU_ID))
+    # The dish of the removed submenu goes with the cascade.
+    assert ('DELETE', construct_url(MENU_ID, REMOVED_SUBMENU_ID, REMOVED_DISH_ID)) not in api.sent
+    assert api.sent.index(('POST', construct_collection_url(MENU_ID, ADDED_SUBMENU_ID))) < (
+        api.sent.index(('POST', construct_collection_url(MENU_ID, ADDED_SUBMENU_ID, ADDED_DISH_ID)))
+    )
+    assert ('PATCH', construct_url(MENU_ID, SUBMENU_ID, DISH_ID)) in api.sent
+    assert set(api.key_to_entity) == set(current.get_key_to_entity())
+    assert fingerprint_index.fingerprints == FingerprintIndex.construct_fingerprints(current)
+
+
+def test_failed_first_sync_is_not_recorded_as_synced():
+    restaurant_menu = construct_restaurant_menu({SUBMENU_ID: [DISH_ID, OTHER_DISH_ID]})
+    api = RecordingRestaurantApi(failing_request=('POST', construct_collection_url(MENU_ID, SUBMENU_ID, DISH_ID)))
+    client = HttpClientAdminRestaurant(transport=api.construct_transport())
+    fingerprint_index = InMemoryFingerprintIndex()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.load_restaurant_menu_changes(restaurant_menu, fingerprint_index))
+    assert fingerprint_index.fingerprints == {}
+
+    api.failing_request = None
+    asyncio.run(client.load_restaurant_menu_changes(restaurant_menu, fingerprint_index))
+    assert set(api.key_to_entity) == set(restaurant_menu.get_key_to_entity())
+    assert fingerprint_index.fingerprints == FingerprintIndex.construct_fingerprints(restaurant_menu)
+
+
+def test_failed_apply_clears_the_fingerprints():
+    api = RecordingRestaurantApi()
+    client = HttpClientAdminRestaurant(transport=api.construct_transport())
+    fingerprint_index = InMemoryFingerprintIndex()
+    restaurant_menu = construct_restaurant_menu({SUBMENU_ID: [DISH_ID]})
+    asyncio.run(client.load_restaurant_menu_changes(restaurant_menu, fingerprint_index))
+
+    api.failing_request = ('PATCH', construct_url(MENU_ID, SUBMENU_ID, DISH_ID))
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.load_restaurant_menu_changes(
+            construct_restaurant_menu({SUBMENU_ID: [DISH_ID]}, price='12.50'), fingerprint_index
+        ))
+    assert fingerprint_index.fingerprints == {}
+
+
+def test_failed_delete_of_a_full_sync_raises():
+    api = RecordingRestaurantApi()
+    client = HttpClientAdminRestaurant(transport=api.construct_transport())
+    asyncio.run(client.load_restaurant_menu_in_db(construct_restaurant_menu({SUBMENU_ID: [DISH_ID, REMOVED_DISH_ID]})))
+
+    api.failing_request = ('DELETE', construct_url(MENU_ID, SUBMENU_ID, REMOVED_DISH_ID))
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.load_restaurant_menu_in_db(construct_restaurant_menu({SUBMENU_ID: [DISH_ID]})))
@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+from task import menu_directory as menu_directory_module
+from task.menu_directory import MenuDirectory
+from task.parser_service import parse_file
+
+
+MENU_CSV = 'new,Menu {index},Menu description\n,new,Submenu,Submenu description\n,,new,Dish,Dish description,10.00\n'
+
+
+def test_files_are_parsed_off_the_event_loop_and_get_their_ids_written(tmp_path, monkeypatch):
+    for index in range(3):
+        (tmp_path / f'menu_{index}.csv').write_text(MENU_CSV.format(index=index))
+    menu_directory = MenuDirectory(str(tmp_path), redis_connection=object())
+    thread_ids = set()
+
+    def record_thread(*args):
+        thread_ids.add(threading.get_ident())
+        return parse_file(*args)
+
+    monkeypatch.setattr(menu_directory_module, 'parse_file', record_thread)
+
+    async def parse_all() -> list:
+        menu_files = [menu_directory.get_menu_file(file_path) for file_path in menu_directory.list_files()]
+        for menu_file in menu_files:
+            await menu_file.parser.check_hash_file(menu_file.path)
+        return await asyncio.gather(*(menu_directory.parse(menu_file) for menu_file in menu_files))
+
+    restaurant_menus = asyncio.run(parse_all())
+
+    assert threading.get_ident() not in thread_ids
+    assert [len(menu.menu_id_submenu_id_dish_id_to_dish) for menu in restaurant_menus] == [1, 1, 1]
+    for index, restaurant_menu in enumerate(restaurant_menus):
+        menu_id, = restaurant_menu.menu_id_to_menu
+        assert (tmp_path / f'menu_{index}.csv').read_text().startswith(menu_id)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from core.config import settings
+from core.metrics import render_metrics
+
+
+SOURCE_DIRECTORY = Path(__file__).parent.parent
+
+WORKER = '''
+import sys
+from core.metrics import CACHE_REQUESTS, DB_POOL_CONNECTIONS, close_metrics
+CACHE_REQUESTS.labels(cache='Menu', kind='one', result='hit').inc()
+DB_POOL_CONNECTIONS.labels(state='open').set(int(sys.argv[1]))
+if sys.argv[2] == 'stopped':
+    close_metrics()
+'''
+
+
+def run_worker(directory: Path, connections: int, state: str) -> None:
+    subprocess.run(
+        [sys.executable, '-c', WORKER, str(connections), state],
+        cwd=SOURCE_DIRECTORY,
+        env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(directory)},
+        check=True,
+    )
+
+
+def test_scrape_sums_the_samples_of_every_worker(monkeypatch, tmp_path):
+    run_worker(tmp_path, 3, 'running')
+    run_worker(tmp_path, 5, 'stopped')
+    monkeypatch.setattr(settings.metrics, 'multiprocess_directory', str(tmp_path))
+
+    lines = render_metrics().decode().splitlines()
+
+    assert 'cache_requests_total{cache="Menu",kind="one",result="hit"} 2.0' in lines
+    assert 'db_pool_connections{state="open"} 3.0' in lines
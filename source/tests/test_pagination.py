@@ -0,0 +1,39 @@
+import base64
+import json
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from repository.pagination import Page
+
+
+ENTITY_ID = str(uuid.uuid4())
+
+
+def construct_cursor(*parts) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(parts)).encode()).decode()
+
+
+def test_issued_cursor_decodes_to_typed_values():
+    page = Page(limit=2, sort='price')
+
+    number, value, entity_id = Page(2, page.encode_cursor(Decimal('12.50'), ENTITY_ID), 'price').decode_cursor()
+
+    assert (number, value, entity_id) == (1, Decimal('12.50'), uuid.UUID(ENTITY_ID))
+
+
+@pytest.mark.parametrize('cursor, sort', [
+    ('not base64!', 'title'),
+    (construct_cursor(1, 'price', 'asc', 'abc', ENTITY_ID), 'price'),
+    (construct_cursor(1, 'price', 'asc', 'NaN', ENTITY_ID), 'price'),
+    (construct_cursor(1, 'title', 'asc', 'Dish', 'not a uuid'), 'title'),
+    (construct_cursor(1, 'title', 'asc', 'Dish', 5), 'title'),
+    (construct_cursor(-1, 'title', 'asc', 'Dish', ENTITY_ID), 'title'),
+    (construct_cursor('1', 'title', 'asc', 'Dish', ENTITY_ID), 'title'),
+    (construct_cursor(1, 'title', 'asc', 'Dish', ENTITY_ID), 'price'),
+    (base64.urlsafe_b64encode(b'{}').decode(), 'title'),
+])
+def test_tampered_cursor_raises_value_error(cursor, sort):
+    with pytest.raises(ValueError):
+        Page(cursor=cursor, sort=sort).decode_cursor()
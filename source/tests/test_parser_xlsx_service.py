@@ -0,0 +1,60 @@
+import asyncio
+
+from openpyxl import load_workbook
+
+from benchmark.generate_workbook import generate_workbook
+from task.parser_xlsx_service import ParserXlsxService, find_row_ranges, shutdown_parse_pool
+
+
+def parse(path: str, workers: int):
+    parser = ParserXlsxService(streaming=True, id_mode='uuid5', workers=workers)
+    parser.load_file(path)
+    try:
+        return asyncio.run(parser.get_restaurant_menu())
+    finally:
+        shutdown_parse_pool()
+
+
+def test_row_ranges_start_on_menu_rows_and_cover_the_sheet(tmp_path):
+    path = str(tmp_path / 'menu.xlsx')
+    rows = generate_workbook(path, menus=6, submenus=2, dishes=3)
+    menu_rows = [1 + menu * (rows // 6) for menu in range(6)]
+
+    row_ranges = find_row_ranges(path, 3)
+
+    assert row_ranges == [(1, 18), (19, 36), (37, None)]
+    assert {min_row for min_row, _ in row_ranges} <= set(menu_rows)
+
+
+def test_more_shards_than_menus_gives_one_range_per_menu(tmp_path):
+    path = str(tmp_path / 'menu.xlsx')
+    generate_workbook(path, menus=2, submenus=1, dishes=2)
+
+    assert find_row_ranges(path, 4) == [(1, 4), (5, None)]
+
+
+def test_read_rows_matches_openpyxl(tmp_path):
+    path = str(tmp_path / 'menu.xlsx')
+    generate_workbook(path, menus=2, submenus=2, dishes=3, missing_id_ratio=0.2)
+    book = load_workbook(path, read_only=True)
+    expected = list(enumerate(book.active.iter_rows(max_col=7, values_only=True), start=1))
+    book.close()
+    parser = ParserXlsxService(streaming=True)
+    parser.load_file(path)
+
+    try:
+        assert list(parser.read_rows()) == expected
+        assert list(parser.read_rows(5, 9)) == expected[4:9]
+        assert list(parser.read_rows(12)) == expected[11:]
+    finally:
+        parser.close()
+
+
+def test_sharded_parse_equals_the_parse_in_process(tmp_path):
+    path = str(tmp_path / 'menu.xlsx')
+    generate_workbook(path, menus=5, submenus=3, dishes=4, missing_id_ratio=0.2)
+
+    restaurant_menu = parse(path, workers=0)
+
+    assert parse(path, workers=3) == restaurant_menu
+    assert len(restaurant_menu.menu_id_submenu_id_dish_id_to_dish) == 5 * 3 * 4
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+from prometheus_client import REGISTRY
+
+from database.redis_cache import CacheEntry, LocalCache, RedisCache
+
+
+def count_lookups(cache: str, kind: str) -> tuple[float, ...]:
+    return tuple(
+        REGISTRY.get_sample_value('local_cache_lookups_total', {'cache': cache, 'kind': kind, 'result': result}) or 0
+        for result in ('hits', 'misses', 'evictions')
+    )
+
+
+class StubPubSub:
+    def __init__(self, messages: list[bytes], subscriptions: list[str]) -> None:
+        self.messages = messages
+        self.subscriptions = subscriptions
+
+    async def __aenter__(self) -> 'StubPubSub':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+    async def subscribe(self, channel: str) -> None:
+        self.subscriptions.append(channel)
+
+    async def listen(self):
+        for data in self.messages:
+            yield {'type': 'message', 'data': data}
+        # Nothing more is published, the listener waits here until it is cancelled.
+        await asyncio.Event().wait()
+
+
+class StubPipeline:
+    def __init__(self, commands: list[str]) -> None:
+        self.commands = commands
+
+    async def __aenter__(self) -> 'StubPipeline':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+    def __getattr__(self, command: str):
+        return lambda *args, **kwargs: self.commands.append(command)
+
+    async def execute(self) -> list:
+        return []
+
+
+class StubRedis:
+    def __init__(self, *connections: list[bytes]) -> None:
+        self.connections = list(connections)
+        self.subscriptions: list[str] = []
+        self.commands: list[str] = []
+
+    def pubsub(self, **kwargs) -> StubPubSub:
+        return StubPubSub(self.connections.pop(0) if self.connections else [], self.subscriptions)
+
+    def pipeline(self, **kwargs) -> StubPipeline:
+        return StubPipeline(self.commands)
+
+
+def test_lookups_are_counted_per_cache_level_and_kind():
+    local_cache = LocalCache(max_entries=2, max_bytes=1024, ttl=60)
+    labels_to_counts = {
+        ('Menu', 'one'): (10, 10, 10),
+        ('Menu', 'tree'): (10, 10, 10),
+        ('Submenu', 'all'): (10, 10, 10),
+        ('Dish', 'one'): (10, 10, 9),
+        ('Dish', 'page'): (10, 10, 9),
+    }
+    before = {labels: count_lookups(*labels) for labels in labels_to_counts}
+
+    for _ in range(10):
+        menu_id, submenu_id, dish_id = (str(uuid.uuid4()) for _ in range(3))
+        for name, key in (
+            ('Menu::Submenu::Dish:', menu_id),
+            ('Menu::Submenu::Dish:', 'Tree'),
+            (f'Menu:{menu_id}:Submenu::Dish:', 'Submenu'),
+            (f'Menu:{menu_id}:Submenu:{submenu_id}:Dish:', dish_id),
+            (f'Menu:{menu_id}:Submenu:{submenu_id}:Dish:Page', 'limit=10'),
+        ):
+            local_cache.get(name, key)
+            local_cache.set(name, key, b'value', local_cache.get_version(name))
+            local_cache.get(name, key)
+
+    assert {
+        labels: tuple(count - count_before for count, count_before in zip(count_lookups(*labels), before[labels]))
+        for labels in labels_to_counts
+    } == labels_to_counts
+
+
+def test_invalidation_keeps_the_reads_of_other_names():
+    local_cache = LocalCache(max_entries=10, max_bytes=1024, ttl=60)
+    menu_version, dish_version = local_cache.get_version('Menu'), local_cache.get_version('Dish')
+
+    local_cache.invalidate('Menu', 'key')
+    local_cache.set('Menu', 'key', b'stale', menu_version)
+    local_cache.set('Dish', 'key', b'value', dish_version)
+
+    assert (local_cache.get('Menu', 'key'), local_cache.get('Dish', 'key')) == (None, b'value')
+    local_cache.clear()
+    local_cache.set('Dish', 'key', b'value', dish_version)
+    assert local_cache.get('Dish', 'key') is None
+
+
+def test_only_writes_publish_an_invalidation(monkeypatch):
+    local_cache = LocalCache(max_entries=10, max_bytes=1024, ttl=60)
+    stub_redis = StubRedis()
+    monkeypatch.setattr(RedisCache, 'local_cache', local_cache)
+    monkeypatch.setattr(RedisCache, 'redis_connection', stub_redis)
+    version = local_cache.get_version('Menu')
+
+    asyncio.run(RedisCache.fill([CacheEntry('Menu', 'key', b'value')]))
+
+    assert 'publish' not in stub_redis.commands
+    assert local_cache.get_version('Menu') == version
+    asyncio.run(RedisCache.hset_many([CacheEntry('Menu', 'key', b'value')]))
+    assert 'publish' in stub_redis.commands
+    assert local_cache.get_version('Menu') != version
+
+
+def test_listener_survives_a_malformed_message_and_resubscribes(monkeypatch, caplog):
+    local_cache = LocalCache(max_entries=10, max_bytes=1024, ttl=60)
+    stub_redis = StubRedis([b'not json'], [json.dumps([['Menu', ['key']]]).encode()])
+    monkeypatch.setattr(RedisCache, 'local_cache', local_cache)
+    monkeypatch.setattr(RedisCache, 'redis_connection', stub_redis)
+    sleep = asyncio.sleep
+
+    async def skip_backoff(delay: float) -> None:
+        await sleep(0)
+
+    async def listen() -> bool:
+        monkeypatch.setattr(asyncio, 'sleep', skip_backoff)
+        listener = asyncio.create_task(RedisCache.listen_invalidation())
+        for _ in range(10):
+            await sleep(0)
+        running = not listener.done()
+        listener.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await listener
+        return running
+
+    assert asyncio.run(listen())
+    assert len(stub_redis.subscriptions) == 2
+    assert 'Invalidation listener failed' in caplog.text
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+from task.runtime import AsyncRuntime
+
+
+async def answer() -> int:
+    await asyncio.sleep(0)
+    return 42
+
+
+def test_tasks_of_the_starting_thread_share_the_loop():
+    runtime = AsyncRuntime()
+    runtime.start()
+    try:
+        loop = runtime.loop
+        assert runtime.run(answer()) == 42
+        assert runtime.run(answer()) == 42
+        assert runtime.loop is loop
+    finally:
+        runtime.stop()
+
+
+def test_run_from_another_thread_is_refused():
+    runtime = AsyncRuntime()
+    runtime.start()
+    errors = []
+
+    def run_in_thread() -> None:
+        try:
+            runtime.run(answer())
+        except RuntimeError as error:
+            errors.append(error)
+
+    try:
+        thread = threading.Thread(target=run_in_thread)
+        thread.start()
+        thread.join()
+    finally:
+        runtime.stop()
+    assert len(errors) == 1
+    assert '--pool=solo' in str(errors[0])
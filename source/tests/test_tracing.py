@@ -0,0 +1,36 @@
+import asyncio
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from core.metrics import track_task
+from core.tracing import trace_methods, tracer
+
+
+exporter = InMemorySpanExporter()
+
+provider = TracerProvider()
+provider.add_span_processor(SimpleSpanProcessor(exporter))
+trace.set_tracer_provider(provider)
+
+
+@trace_methods
+class Service:
+    async def write(self) -> str:
+        return 'written'
+
+
+def test_background_task_hangs_under_the_span_that_queued_it():
+    exporter.clear()
+    with tracer.start_as_current_span('request'):
+        task = track_task(Service().write)
+
+    # The task runs after the request span ended, the way BackgroundTasks run after the response.
+    assert asyncio.run(task()) == 'written'
+
+    name_to_span = {span.name: span for span in exporter.get_finished_spans()}
+    assert name_to_span['background write'].parent.span_id == name_to_span['request'].context.span_id
+    assert name_to_span['Service.write'].parent.span_id == name_to_span['background write'].context.span_id
+    assert name_to_span['background write'].attributes['queue_seconds'] >= 0